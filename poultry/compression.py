@@ -0,0 +1,267 @@
+"""Compressed file formats.
+
+The format of a file is chosen by its extension:
+
+* ``.gz``: gzip, accelerated by `isal`_ or `zlib-ng`_ if one of them is
+  installed, otherwise the standard library :mod:`gzip` is used.
+* ``.bz2``: bzip2.
+* ``.zst``: Zstandard, requires the `zstandard`_ package.
+* ``.lz4``: LZ4 frames, requires the `lz4`_ package.
+
+Files with other extensions are read as they are. Appending to a
+compressed file adds a new stream (member or frame), all the streams of a
+file are read.
+
+Zstandard files can also be written in independently compressed blocks with
+a shared dictionary, see :func:`train_dictionary`. Such a file starts with a
+skippable frame that contains the dictionary, followed by a frame per
+block, each block ends at a line end. The dictionary is picked up when the
+file is read, other Zstandard tools need it to be extracted to a file.
+
+.. _isal: https://pypi.org/project/isal/
+.. _zlib-ng: https://pypi.org/project/zlib-ng/
+.. _zstandard: https://pypi.org/project/zstandard/
+.. _lz4: https://pypi.org/project/lz4/
+
+"""
+import bz2
+import gzip
+import io
+import logging
+import os
+import struct
+
+from collections import OrderedDict
+
+
+logger = logging.getLogger(__name__)
+
+
+def _isal_gzip():
+    from isal import igzip
+
+    def open_(file_name, mode, level):
+        return igzip.open(file_name, mode, compresslevel=_isal_level(level))
+
+    return open_
+
+
+def _isal_level(level):
+    """Map a gzip level from 0 to 9 to an ISA-L level from 0 to 3.
+
+    >>> [_isal_level(level) for level in range(10)]
+    [0, 0, 0, 0, 1, 1, 2, 2, 3, 3]
+
+    """
+    return min(3, max(0, (level - 1) * 4 // 9))
+
+
+def _zlib_ng_gzip():
+    from zlib_ng import gzip_ng
+
+    def open_(file_name, mode, level):
+        return gzip_ng.open(file_name, mode, compresslevel=level)
+
+    return open_
+
+
+def _gzip():
+    def open_(file_name, mode, level):
+        return gzip.open(file_name, mode, compresslevel=level)
+
+    return open_
+
+
+def _bz2():
+    def open_(file_name, mode, level):
+        return bz2.open(file_name, mode, compresslevel=level)
+
+    return open_
+
+
+def _zstd():
+    import zstandard
+
+    def open_(file_name, mode, level, dictionary=None):
+        if 'r' in mode:
+            f = open(file_name, 'rb')
+            dictionary = _read_dictionary_frame(f)
+            if dictionary is None:
+                f.seek(0)
+            else:
+                dictionary = zstandard.ZstdCompressionDict(dictionary)
+
+            reader = zstandard.ZstdDecompressor(dict_data=dictionary).stream_reader(
+                f, read_across_frames=True,
+            )
+            return io.BufferedReader(reader)
+
+        if dictionary is None:
+            f = open(file_name, mode)
+            return zstandard.ZstdCompressor(level=level).stream_writer(f)
+
+        write_frame = True
+        if 'a' in mode and os.path.exists(file_name) and os.path.getsize(file_name):
+            with open(file_name, 'rb') as f:
+                if _read_dictionary_frame(f) != dictionary:
+                    raise ValueError(
+                        "Can't append to {}, it is not compressed with the dictionary.".format(file_name)
+                    )
+            write_frame = False
+
+        f = open(file_name, mode)
+        if write_frame:
+            f.write(struct.pack('<II', DICTIONARY_FRAME_MAGIC, len(dictionary)) + dictionary)
+
+        compressor = zstandard.ZstdCompressor(
+            level=level, dict_data=zstandard.ZstdCompressionDict(dictionary),
+        )
+        return _BlockWriter(f, compressor.compress)
+
+    return open_
+
+
+def _lz4():
+    import lz4.frame
+
+    def open_(file_name, mode, level):
+        return lz4.frame.open(file_name, mode, compression_level=level)
+
+    return open_
+
+
+#: Loaders of the implementations of a format by file extension, the
+#: fastest go first.
+CODECS = OrderedDict(
+    [
+        ('.gz', [('isal', _isal_gzip), ('zlib-ng', _zlib_ng_gzip), ('gzip', _gzip)]),
+        ('.bz2', [('bz2', _bz2)]),
+        ('.zst', [('zstandard', _zstd)]),
+        ('.lz4', [('lz4', _lz4)]),
+    ]
+)
+
+_openers = {}
+
+
+def codec(file_name):
+    """The extension of the file's format, `None` if it is not compressed.
+
+    >>> codec('2012-04-13.zst'), codec('2012-04-13.json')
+    ('.zst', None)
+
+    """
+    for extension in CODECS:
+        if file_name.endswith(extension):
+            return extension
+
+    return None
+
+
+def _opener(extension):
+    try:
+        return _openers[extension]
+    except KeyError:
+        pass
+
+    for name, loader in CODECS[extension]:
+        try:
+            opener = loader()
+        except ImportError:
+            continue
+
+        logger.debug('Using %s for %s files.', name, extension)
+        _openers[extension] = opener
+        return opener
+
+    raise ImportError(
+        '{} files require one of: {}.'.format(extension, ', '.join(n for n, _ in CODECS[extension]))
+    )
+
+
+def open_file(file_name, mode='rb', level=6, default=None, dictionary=None):
+    """Open a file in a binary mode, (de)compressing it by its extension.
+
+    :param mode: ``rb``, ``wb`` or ``ab``.
+    :param level: the compression level, its range depends on the format.
+    :param default: the extension of the format of the files with an unknown
+                    extension, they are not compressed by default.
+    :param dictionary: a Zstandard dictionary to write a ``.zst`` file in
+                       blocks, see :func:`train_dictionary`. Files of the
+                       other formats are written without it.
+
+    """
+    extension = codec(file_name) or default
+    if extension is None:
+        return open(file_name, mode)
+
+    if dictionary is not None and extension == '.zst':
+        return _opener(extension)(file_name, mode, level, dictionary=dictionary)
+
+    return _opener(extension)(file_name, mode, level)
+
+
+def openhook(file_name, mode, **kwargs):
+    """An :class:`fileinput.FileInput` hook that decompresses the files."""
+    return open_file(file_name, mode)
+
+
+def train_dictionary(samples, size=2 ** 17):
+    """Train a Zstandard dictionary on sample lines.
+
+    :param samples: a list of lines as bytes, see
+                    :func:`poultry.consumers.sample`.
+    :param size: the maximal size of the dictionary in bytes.
+
+    :return: the dictionary as bytes.
+
+    """
+    import zstandard
+
+    return zstandard.train_dictionary(size, samples).as_bytes()
+
+
+#: The magic number of the skippable frame that holds a dictionary.
+DICTIONARY_FRAME_MAGIC = 0x184D2A5D
+
+
+def _read_dictionary_frame(f):
+    """Read the dictionary frame at the beginning of a file, if there is one."""
+    header = f.read(8)
+    if len(header) == 8:
+        magic, size = struct.unpack('<II', header)
+        if magic == DICTIONARY_FRAME_MAGIC:
+            return f.read(size)
+
+    return None
+
+
+class _BlockWriter(object):
+    """A file that compresses blocks of lines independently.
+
+    :param compress: a function that compresses a block to a frame.
+
+    """
+
+    def __init__(self, file_, compress, block_size=2 ** 16):
+        self.file = file_
+        self.compress = compress
+        self.block_size = block_size
+
+    def write(self, data):
+        start = 0
+        while start < len(data):
+            end = data.find(b'\n', start + self.block_size - 1)
+            end = len(data) if end == -1 else end + 1
+
+            self.file.write(self.compress(data[start:end]))
+            start = end
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -7,6 +7,7 @@ except ImportError:
 from sys import version_info
 PY2 = version_info < (3, )
 
+from poultry.matchers import Matcher
 from poultry.tweet import Coordinates, Tweet
 
 
@@ -129,6 +130,10 @@ class Filter(object):
 
         return Filter(**predicates)
 
+    def compile(self):
+        """Compile the predicates to an immutable :class:`poultry.matchers.Matcher`."""
+        return Matcher(**self.predicates)
+
     @property
     def predicates(self):
         return {'follow': self.follow,
@@ -1,7 +1,9 @@
 from __future__ import print_function
 
-import gzip
+import codecs
+import functools
 import logging
+import random
 import sys
 import time
 import csv
@@ -11,12 +13,16 @@ try:
 except ImportError:
     from queue import Full
 
-from collections import OrderedDict, Counter
+from collections import Counter
 from contextlib import contextmanager
 from itertools import chain
 from pprint import pprint as _pprint
 
+from poultry import compression
+from poultry.sketches import HyperLogLog
+from poultry.timestamps import Bucketer, datetime_to_seconds
 from poultry.tweet import Tweet, TweetValueError
+from poultry.writers import WriterPool
 
 
 logger = logging.getLogger(__name__)
@@ -56,12 +62,83 @@ def show(output=None, template=u'{t}\n'):
 
 @consumer
 def print_(output=None, template=u'{}\n'):
-    """Print stripped items."""
+    """Print stripped items.
+
+    Binary items (for example, raw tweets read in the binary mode) are
+    written to the underlying binary buffer of the output as they are, if
+    the output is UTF-8 encoded.
+
+    """
     if output is None:
         output = sys.stdout
+
+    buffer = _binary_buffer(output)
+    prefix, placeholder, suffix = template.partition(u'{}')
+    if buffer is not None and placeholder and u'{' not in prefix + suffix:
+        prefix = prefix.encode('utf-8')
+        suffix = suffix.encode('utf-8') + b'\n'
+    else:
+        buffer = None
+
+    text_written = False
     while True:
         item = yield
+
+        if isinstance(item, Tweet):
+            item = item.raw
+
+        if isinstance(item, bytes):
+            if buffer is not None:
+                if text_written:
+                    output.flush()
+                    text_written = False
+
+                buffer.write(prefix + item.strip(b'\n') + suffix)
+                continue
+
+            item = item.decode('utf-8')
+
         print(template.format((item).strip('\n')), file=output)
+        text_written = True
+
+
+def _binary_buffer(output):
+    """The binary buffer of a UTF-8 encoded text output, if there is one."""
+    buffer = getattr(output, 'buffer', None)
+    encoding = getattr(output, 'encoding', None)
+
+    if buffer is not None and encoding and codecs.lookup(encoding).name == 'utf-8':
+        return buffer
+
+
+@consumer
+def collect(items):
+    """Append the input items to a list."""
+    while True:
+        items.append((yield))
+
+
+@consumer
+def sample(items, size, seed=0):
+    """Keep a uniform sample of the input items in a list.
+
+    :param size: the maximal size of the sample.
+
+    """
+    random_ = random.Random(seed)
+    seen = 0
+
+    while True:
+        item = yield
+
+        if seen < size:
+            items.append(item)
+        else:
+            i = random_.randint(0, seen)
+            if i < size:
+                items[i] = item
+
+        seen += 1
 
 
 @consumer
@@ -94,8 +171,25 @@ def counter_printer(output=None):
 
 
 @consumer
-def to_tweet(target):
-    """Convert the input items to tweets."""
+def top_printer(output=None, k=10):
+    """Print the `k` most common items of the counters, such as the sketches of :mod:`poultry.sketches`."""
+    if output is None:
+        output = sys.stdout
+    while True:
+        counter = yield
+
+        for key, value in counter.most_common(k):
+            output.write('{} {}\n'.format(key, value))
+
+
+@consumer
+def to_tweet(target, fields=None):
+    """Convert the input items to tweets.
+
+    :param fields: the tweet fields the target needs. If it is given, the
+                   tweets are lazy, see :class:`poultry.tweet.Tweet`.
+
+    """
     result = None
 
     with closing(target):
@@ -103,51 +197,90 @@ def to_tweet(target):
             item = yield result
 
             try:
-                tweet = Tweet(item)
+                tweet = item if isinstance(item, Tweet) else Tweet(item, fields=fields)
             except TweetValueError:
                 result = SendNext
             else:
                 result = target.send(tweet)
 
 
+@consumer
+def prefilter(target, predicate):
+    """Pass only the items that satisfy the predicate.
+
+    It is meant to drop raw lines cheaply before they are decoded, for
+    example by :class:`poultry.matchers.RawPrefilter`.
+
+    """
+    result = None
+
+    with closing(target):
+        while True:
+            item = yield result
+            result = target.send(item) if predicate(item) else SendNext
+
+
 @consumer
 def group(
     file_name_template='%Y-%m-%d-%H.gz',
-    max_open_files=1,
+    max_open_files=32,
     mode='a',
+    compression_level=6,
+    threads=None,
+    dictionary=None,
+    on_open=print,
+    rename=None,
 ):
-    """Group tweets to files by date according to the file_name_template."""
-    files = OrderedDict()
-
-    try:
-        while True:
-            tweet = yield
+    """Group tweets to files by date according to the file_name_template.
+
+    The files are compressed according to their extension, see
+    :mod:`poultry.compression`, gzip is used for unknown extensions.
+
+    :param max_open_files: the maximal number of files that are kept open,
+                           see :class:`poultry.writers.WriterPool`.
+    :param compression_level: the compression level, for gzip from 1 (fast)
+                              to 9 (small).
+    :param threads: optional :class:`poultry.writers.WriterThreads` that
+                    compress and write the files. The caller has to join
+                    them after the consumer is closed.
+    :param dictionary: a Zstandard dictionary to compress ``.zst`` files in
+                       blocks with, see
+                       :func:`poultry.compression.train_dictionary`.
+    :param on_open: a function that is called with a file name when the file
+                    is opened, by default the name is printed.
+    :param rename: a function that maps a file name given by the template and
+                   the mode it is opened in to the name of the file that is
+                   written.
 
-            created_at = tweet.created_at.strftime(file_name_template)
-
-            try:
-                f = files[created_at]
-            except KeyError:
-                print(created_at)
+    """
+    open_file = functools.partial(
+        compression.open_file,
+        level=compression_level,
+        default='.gz',
+        dictionary=dictionary,
+    )
+
+    if rename is not None:
+        def opener(file_name, mode):
+            return open_file(rename(file_name, mode), mode)
+    else:
+        opener = open_file
 
-                if len(files) > max_open_files:
-                    files = OrderedDict(sorted(files.items()))
+    bucketer = Bucketer(file_name_template)
 
-                    _, first = files.popitem(last=False)
-                    first.close()
+    with WriterPool(max_open_files, mode=mode, opener=opener, on_open=on_open, threads=threads) as files:
+        while True:
+            tweet = yield
 
-                f = gzip.open(created_at, '{}t'.format(mode))
-                files[created_at] = f
+            raw = tweet.raw
+            if not isinstance(raw, bytes):
+                raw = raw.encode('utf-8')
 
-            f.write("{t}\n".format(t=tweet.raw))
-
-    finally:
-        for f in files.values():
-            f.close()
+            files.write(bucketer(tweet.created_at), raw + b'\n')
 
 
 @consumer
-def filter(streams, dustbin=None, send_to_all=True):
+def filter(streams, dustbin=None, send_to_all=True, matcher=None):
     """Filter items to flows by filtering predicates.
 
     :param streams: sequence of `(target, predicate)` pairs.
@@ -156,6 +289,12 @@ def filter(streams, dustbin=None, send_to_all=True):
                         satisfies several predicates it will be sent
                         to only one.
 
+    :param matcher: an optional function that evaluates all the predicates
+                    at once. Given an item, it returns the indices of the
+                    streams the item has to be sent to, for example
+                    :class:`poultry.matchers.FilterSet`. If it is
+                    provided, the predicates of the streams are not used.
+
     `predicate` is a function: current, first --> Bool
 
     """
@@ -172,13 +311,22 @@ def filter(streams, dustbin=None, send_to_all=True):
 
         while True:
             sent = False
-            for target, predicate in streams:
-                if predicate(current, first):
-                    target.send(current)
+
+            if matcher is not None:
+                for i in matcher(current):
+                    streams[i][0].send(current)
                     sent = True
 
                     if not send_to_all:
                         break
+            else:
+                for target, predicate in streams:
+                    if predicate(current, first):
+                        target.send(current)
+                        sent = True
+
+                        if not send_to_all:
+                            break
 
             if dustbin is not None and not sent:
                 dustbin.send(current)
@@ -188,20 +336,51 @@ def filter(streams, dustbin=None, send_to_all=True):
 
 
 @consumer
-def uniq(target, seen_ids=None):
-    """Omit repeated tweets."""
-    seen_ids = set(seen_ids) if seen_ids is not None else set()
+def uniq(target, seen_ids=None, ids=None, remember=True):
+    """Omit repeated tweets.
+
+    :param seen_ids: the ids of the tweets to omit.
+    :param ids: the container to remember the seen ids in, a set by
+                default. See :mod:`poultry.dedup` for the ones that use
+                bounded memory.
+    :param remember: whether to add the ids of the passed tweets to `ids`.
+                     If it is `False`, the ids are expected to be added
+                     further down the pipeline, see :func:`record_ids`.
+
+    """
+    if ids is None:
+        ids = set()
+
+    for id_ in seen_ids or ():
+        ids.add(id_)
 
     with closing(target):
         while True:
             tweet = yield
             id_ = tweet.id
 
-            if id_ not in seen_ids:
-                seen_ids.add(id_)
+            if id_ not in ids:
+                if remember:
+                    ids.add(id_)
                 target.send(tweet)
 
 
+@consumer
+def record_ids(target, ids):
+    """Add the ids of the tweets that are sent to the target to `ids`.
+
+    Unlike :func:`uniq`, it doesn't omit any tweets, so that a tweet can be
+    sent to several targets, each of them records it.
+
+    """
+    with closing(target):
+        while True:
+            tweet = yield
+
+            target.send(tweet)
+            ids.add(tweet.id)
+
+
 @consumer
 def split(*targets):
     """Send the input items to each target."""
@@ -239,23 +418,36 @@ def count(*counters, **kwargs):
     :param provider: a function which provides elements that have to
                      be counted given an input item.
 
+    :param batch_size: the number of elements that are collected before
+                       they are counted at once.
+
+    :param factory: a function that creates the counter of a batch, see
+                    :func:`lazy_counter`.
+
     """
     provider = kwargs.get('provider', None)
     target = kwargs.get('target', None)
+    batch_size = kwargs.get('batch_size', 2 ** 16)
+    factory = kwargs.get('factory', Counter)
     targets = [target] if target else []
 
     if provider is None:
         provider = lambda x: [x]
 
-    if not counters:
-        counters = Counter(),
-
     with closing(*targets):
         while True:
-            with lazy_counter(*counters, target=target) as c:
-                while True:
-                    item = yield
-                    c.update(provider(item))
+            with lazy_counter(*counters, target=target, factory=factory) as c:
+                items = []
+                try:
+                    while True:
+                        item = yield
+                        items.extend(provider(item))
+
+                        if len(items) >= batch_size:
+                            c.update(items)
+                            del items[:]
+                finally:
+                    c.update(items)
 
 
 def count_tokens(*counters, **kwargs):
@@ -271,11 +463,70 @@ def count_tokens(*counters, **kwargs):
 
 
 def timeline(*counters, **kwargs):
-    """Count tweet's creation time."""
-    window = kwargs.pop('window', '%Y-%m-%d-%H')
-    kwargs['provider'] = lambda tweet: [tweet.created_at.strftime(window)]
+    """Count tweet's creation time.
+
+    :param window: a strftime template that names the time windows.
+
+    The creation times are collected in batches of `batch_size` and are
+    counted by :meth:`poultry.timestamps.Bucketer.counts`, otherwise the
+    arguments are the same as of :func:`count`.
+
+    """
+    bucketer = Bucketer(kwargs.pop('window', '%Y-%m-%d-%H'))
+
+    if bucketer.granularity == 1:
+        kwargs['provider'] = lambda tweet: [bucketer(tweet.created_at)]
+        return count(*counters, **kwargs)
+
+    return _count_windows(bucketer, counters, **kwargs)
 
-    return count(*counters, **kwargs)
+
+@consumer
+def _count_windows(bucketer, counters, target=None, batch_size=2 ** 16):
+    targets = [target] if target else []
+
+    with closing(*targets):
+        while True:
+            with lazy_counter(*counters, target=target) as c:
+                seconds = []
+                try:
+                    while True:
+                        tweet = yield
+                        seconds.append(datetime_to_seconds(tweet.created_at))
+
+                        if len(seconds) >= batch_size:
+                            c.update(bucketer.counts(seconds))
+                            del seconds[:]
+                finally:
+                    c.update(bucketer.counts(seconds))
+
+
+@consumer
+def distinct(sketches, provider, window='%Y-%m-%d-%H', precision=12):
+    """Estimate the number of distinct values per time window.
+
+    :param sketches: a dictionary from window names to
+                     :class:`poultry.sketches.HyperLogLog` sketches, the
+                     sketches are added and updated. Sketches of different
+                     runs are merged by :meth:`~poultry.sketches.HyperLogLog.update`.
+    :param provider: a function which provides the values of a tweet.
+    :param window: a strftime template that names the time windows.
+    :param precision: the precision of the new sketches.
+
+    """
+    bucketer = Bucketer(window)
+
+    while True:
+        tweet = yield
+
+        name = bucketer(tweet.created_at)
+        try:
+            sketch = sketches[name]
+        except KeyError:
+            sketch = sketches[name] = HyperLogLog(precision)
+
+        for value in provider(tweet):
+            sketch.add(value)
 
 
 @consumer
@@ -316,10 +567,17 @@ def batch(target, flow_name=None, splitter=None):
 
 @contextmanager
 def lazy_counter(*counters, **kwargs):
-    """Delay the update of the counter."""
+    """Delay the update of the counter.
+
+    :param factory: a function that creates the local counter, for example
+                    :meth:`poultry.sketches.SpaceSaving.for_memory` to bound
+                    the memory used by a batch.
+
+    """
     target = kwargs.get('target')
+    factory = kwargs.get('factory', Counter)
 
-    local_counter = Counter()
+    local_counter = factory()
     try:
         yield local_counter
     except BatchEndException:
@@ -404,19 +662,34 @@ class SendNext(object):
 def extract_retweets(target):
     """Extract retweets.
 
+    The lines that contain a retweet are decoded once and sent further as
+    :class:`poultry.tweet.Tweet` objects, preceded by the retweeted tweet.
+    The other lines are passed as they are.
+
     Note that it doesn't keep track of duplicates and the order.
 
     """
+    with closing(target):
+        while True:
+            item = yield
 
-    while True:
-        raw_tweet = yield
-        tweet = Tweet(raw_tweet)
+            if isinstance(item, Tweet):
+                tweet = item
+            elif (b'"retweeted_status"' if isinstance(item, bytes) else '"retweeted_status"') in item:
+                try:
+                    tweet = Tweet(item)
+                except TweetValueError:
+                    target.send(item)
+                    continue
+            else:
+                target.send(item)
+                continue
 
-        retweeted_status = tweet.parsed.get('retweeted_status', None)
-        if retweeted_status:
-            target.send(retweeted_status)
+            retweeted_status = tweet.retweeted_status
+            if retweeted_status is not None:
+                target.send(retweeted_status)
 
-        target.send(raw_tweet)
+            target.send(tweet)
 
 
 @consumer
@@ -0,0 +1,324 @@
+"""Bounded memory sets of seen tweet ids.
+
+:class:`SlidingWindow` remembers the ids of the tweets created within a
+time window, :class:`BloomFilter` remembers all the ids, but may mistake a
+new id for a seen one. :class:`IdIndex` keeps the ids on disk between runs.
+All of them can be used by :func:`poultry.consumers.uniq`.
+
+"""
+import bisect
+import heapq
+import logging
+import math
+import mmap
+import os
+import struct
+import sys
+
+from poultry.timestamps import SNOWFLAKE_MIN_ID
+
+
+logger = logging.getLogger(__name__)
+
+
+class SlidingWindow(object):
+    """Ids of the tweets created within a time window.
+
+    Snowflake ids are ordered by creation time, so the ids that are older
+    than the newest one by more than the window are forgotten. Ids that
+    were not generated by Snowflake are never forgotten.
+
+    A repeated id is found if the copies are less than `window` seconds
+    apart, judged by the creation time encoded in the ids. Tweets that are
+    older than the window are not remembered and are never reported as
+    seen.
+
+    :param window: the length of the window in seconds.
+
+    >>> ids = SlidingWindow(window=60)
+    >>> ids.add(190800262909276162)
+    >>> 190800262909276162 in ids
+    True
+    >>> ids.add(190800262909276162 + (61000 << 22))
+    >>> 190800262909276162 in ids, len(ids)
+    (False, 1)
+
+    """
+
+    def __init__(self, window=24 * 3600):
+        self.window = window
+
+        self._ids = set()
+        self._heap = []
+        self._horizon = 0
+
+    def __contains__(self, id_):
+        return id_ in self._ids
+
+    def __len__(self):
+        return len(self._ids)
+
+    def add(self, id_):
+        """Remember an id and forget the ones that left the window."""
+        if id_ <= SNOWFLAKE_MIN_ID:
+            self._ids.add(id_)
+            return
+
+        if id_ < self._horizon:
+            return
+
+        self._ids.add(id_)
+        heapq.heappush(self._heap, id_)
+
+        # The ids of the tweets created `window` seconds before this one.
+        horizon = id_ - ((self.window * 1000) << 22)
+        if horizon > self._horizon:
+            self._horizon = horizon
+
+            heap = self._heap
+            while heap[0] < horizon:
+                self._ids.discard(heapq.heappop(heap))
+
+
+class BloomFilter(object):
+    """A Bloom filter of integer ids.
+
+    An id that was added is always found, an id that was not added is found
+    with the probability of about `error_rate` while no more than
+    `capacity` ids are added.
+
+    :param bits: the size of the filter in bits.
+    :param hashes: the number of bits set per id.
+
+    >>> ids = BloomFilter.for_capacity(1000, error_rate=0.01)
+    >>> ids.bits, ids.hashes
+    (9586, 7)
+    >>> ids.add(190800262909276162)
+    >>> 190800262909276162 in ids, 195415832510201856 in ids
+    (True, False)
+
+    """
+
+    def __init__(self, bits, hashes):
+        self.bits = bits
+        self.hashes = hashes
+        self.count = 0
+
+        self._array = bytearray((bits + 7) // 8)
+
+    @classmethod
+    def for_capacity(cls, capacity, error_rate=1e-6):
+        """A filter for `capacity` ids with the given false positive rate."""
+        bits = int(math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        return cls(bits, cls._optimal_hashes(error_rate))
+
+    @classmethod
+    def for_memory(cls, size, error_rate=1e-6):
+        """A filter of `size` bytes with the given false positive rate.
+
+        The fewer ids are added, the lower the rate is. :attr:`capacity` is
+        the number of ids the rate is reached at.
+
+        """
+        return cls(size * 8, cls._optimal_hashes(error_rate))
+
+    @staticmethod
+    def _optimal_hashes(error_rate):
+        return max(1, int(round(-math.log(error_rate, 2))))
+
+    @property
+    def capacity(self):
+        """The number of ids that can be added at the false positive rate."""
+        return int(self.bits * math.log(2) / self.hashes)
+
+    def _positions(self, id_):
+        # Double hashing with two halves of a 64 bit mix of the id.
+        h = _mix64(id_)
+        h1, h2 = h & 0xFFFFFFFF, (h >> 32) | 1
+
+        bits = self.bits
+        return [(h1 + i * h2) % bits for i in range(self.hashes)]
+
+    def __contains__(self, id_):
+        array = self._array
+        return all(array[p >> 3] & (1 << (p & 7)) for p in self._positions(id_))
+
+    def add(self, id_):
+        array = self._array
+        for p in self._positions(id_):
+            array[p >> 3] |= 1 << (p & 7)
+
+        self.count += 1
+        if self.count == self.capacity + 1:
+            logger.warning(
+                'More than %s ids are added to the Bloom filter, '
+                'the false positive rate is higher than expected.',
+                self.capacity,
+            )
+
+
+def _mix64(x):
+    """The SplitMix64 finalizer."""
+    x = (x ^ (x >> 30)) * 0xBF58476D1CE4E5B9 & 0xFFFFFFFFFFFFFFFF
+    x = (x ^ (x >> 27)) * 0x94D049BB133111EB & 0xFFFFFFFFFFFFFFFF
+    return x ^ (x >> 31)
+
+
+class IdIndex(object):
+    """A persistent set of tweet ids.
+
+    The ids are stored in two files: `path` is a sorted array of 64 bit
+    little endian unsigned integers, which is memory mapped and binary
+    searched, and ``path + '.log'`` is the same kind of array of the ids
+    added since the last compaction, in the order they were added. The ids
+    of the log are also kept in memory. When there are more than
+    `compact_threshold` of them, they are merged to the sorted array.
+
+    Only one process may use the index at a time.
+
+    :param path: the file name of the sorted array, the files are created
+                 if they don't exist.
+    :param compact_threshold: the maximal number of ids in the log.
+
+    >>> import tempfile
+    >>> path = os.path.join(tempfile.mkdtemp(), 'ids')
+    >>> with IdIndex(path, compact_threshold=2) as ids:
+    ...     for id_ in 3, 1, 2, 3:
+    ...         ids.add(id_)
+    >>> with IdIndex(path) as ids:
+    ...     len(ids), 2 in ids, 4 in ids
+    (3, True, False)
+
+    """
+
+    def __init__(self, path, compact_threshold=2 ** 20):
+        self.path = path
+        self.log_path = path + '.log'
+        self.compact_threshold = compact_threshold
+
+        self._file = None
+        self._mmap = None
+        self._ids = ()
+        self._map()
+
+        self._log = set()
+        if os.path.exists(self.log_path):
+            with open(self.log_path, 'r+b') as f:
+                data = f.read()
+
+                # Drop an id that was not written completely.
+                if len(data) % 8:
+                    data = data[:len(data) - len(data) % 8]
+                    f.truncate(len(data))
+
+            self._log.update(i for (i, ) in _UINT64.iter_unpack(data))
+
+        self._log_file = open(self.log_path, 'ab')
+
+    def _map(self):
+        if not os.path.exists(self.path):
+            open(self.path, 'wb').close()
+
+        self._file = open(self.path, 'rb')
+        if os.path.getsize(self.path):
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            self._ids = _uint64_view(self._mmap)
+
+    def _unmap(self):
+        if isinstance(self._ids, memoryview):
+            self._ids.release()
+        self._ids = ()
+
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+
+        self._file.close()
+
+    def __contains__(self, id_):
+        if id_ in self._log:
+            return True
+
+        ids = self._ids
+        i = bisect.bisect_left(ids, id_)
+        return i < len(ids) and ids[i] == id_
+
+    def __len__(self):
+        return len(self._ids) + len(self._log)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def add(self, id_):
+        """Add an id to the index."""
+        if id_ in self:
+            return
+
+        self._log.add(id_)
+        self._log_file.write(_UINT64.pack(id_))
+
+        if len(self._log) > self.compact_threshold:
+            self.compact()
+
+    def compact(self):
+        """Merge the log to the sorted array."""
+        if not self._log:
+            return
+
+        logger.debug('Merging %s ids to %s ids in %s.', len(self._log), len(self._ids), self.path)
+
+        ids = self._ids
+        data = self._mmap if self._mmap is not None else b''
+        new_path = self.path + '.new'
+
+        with open(new_path, 'wb') as f:
+            # Copy the ranges of the sorted ids between the new ones.
+            start = 0
+            for id_ in sorted(self._log):
+                end = bisect.bisect_left(ids, id_)
+                f.write(data[start * 8:end * 8])
+                f.write(_UINT64.pack(id_))
+                start = end
+            f.write(data[start * 8:])
+
+            f.flush()
+            os.fsync(f.fileno())
+
+        self._unmap()
+        os.replace(new_path, self.path)
+        self._map()
+
+        self._log.clear()
+        self._log_file.close()
+        self._log_file = open(self.log_path, 'wb')
+
+    def close(self):
+        """Close the files, the log is not compacted."""
+        self._log_file.close()
+        self._unmap()
+
+
+_UINT64 = struct.Struct('<Q')
+
+
+class _UnpackedIds(object):
+    """A sequence of little endian 64 bit unsigned integers in a buffer."""
+
+    def __init__(self, buffer_):
+        self.buffer = buffer_
+
+    def __len__(self):
+        return len(self.buffer) // 8
+
+    def __getitem__(self, i):
+        return _UINT64.unpack_from(self.buffer, i * 8)[0]
+
+
+def _uint64_view(buffer_):
+    if sys.byteorder == 'little':
+        return memoryview(buffer_).cast('Q')
+
+    return _UnpackedIds(buffer_)
@@ -0,0 +1,180 @@
+"""Pluggable json backends.
+
+The available backends are ``orjson``, ``ujson`` and the standard library
+``json``. The backend is chosen by :func:`set_backend`, the
+``POULTRY_JSON_BACKEND`` environment variable or the ``--json-backend``
+command line option. By default (``auto``) the fastest installed backend is
+used. If the requested backend is not installed, the next available one is
+used instead. An unknown name in the environment variable is ignored with a
+warning. Lines that a fast backend rejects are decoded by the standard
+library, so the backends accept the same input. Encoding is always done by
+the standard library, so the output doesn't depend on the backend.
+
+Use :func:`loads` of this module, not the imported name, as it is rebound
+when the backend changes.
+
+"""
+import json
+import logging
+import os
+import time
+
+from collections import OrderedDict
+
+
+logger = logging.getLogger(__name__)
+
+ENVIRONMENT_VARIABLE = 'POULTRY_JSON_BACKEND'
+
+
+def _orjson():
+    import orjson
+
+    return _with_fallback(orjson.loads)
+
+
+def _ujson():
+    import ujson
+
+    return _with_fallback(ujson.loads)
+
+
+def _json():
+    return json.loads
+
+
+def _with_fallback(fast_loads):
+    """Decode with the standard library what a fast backend rejects.
+
+    orjson, for example, rejects lone surrogates such as ``"\\ud83d"``,
+    which are common in truncated texts, but :func:`json.loads` accepts
+    them.
+
+    """
+    def loads(s):
+        try:
+            return fast_loads(s)
+        except ValueError:
+            return json.loads(s)
+
+    return loads
+
+
+def dumps(obj):
+    """Serialize an object as :func:`json.dumps` does with the default options.
+
+    The output doesn't depend on the backend: it's ASCII and the items are
+    separated by ``, `` and ``: ``.
+
+    """
+    return json.dumps(obj, ensure_ascii=True, separators=(', ', ': '))
+
+
+#: Backend loaders, the fastest go first.
+BACKENDS = OrderedDict(
+    [
+        ('orjson', _orjson),
+        ('ujson', _ujson),
+        ('json', _json),
+    ]
+)
+
+backend = None
+loads = json.loads
+
+
+def available_backends():
+    """The names of the installed backends, the fastest go first."""
+    result = []
+    for name, loader in BACKENDS.items():
+        try:
+            loader()
+        except ImportError:
+            continue
+        result.append(name)
+
+    return result
+
+
+def set_backend(name='auto'):
+    """Select the json backend.
+
+    :param name: either a name from :data:`BACKENDS` or ``auto``.
+
+    :return: the name of the selected backend.
+
+    """
+    global backend, loads
+
+    if name != 'auto' and name not in BACKENDS:
+        raise ValueError(
+            'Unknown json backend {!r}, use one of: auto, {}.'.format(name, ', '.join(BACKENDS))
+        )
+
+    candidates = list(BACKENDS)
+    if name != 'auto':
+        # Fall back to the backends that follow the requested one, the
+        # standard library one is always available.
+        candidates = candidates[candidates.index(name):]
+
+    for candidate in candidates:
+        try:
+            loads = BACKENDS[candidate]()
+        except ImportError:
+            if candidate == name:
+                logger.warning('The %s json backend is not installed.', name)
+        else:
+            backend = candidate
+            break
+
+    logger.debug('Using the %s json backend.', backend)
+    return backend
+
+
+def benchmark(lines, backends=None, repeat=3):
+    """Measure decoding throughput of the backends.
+
+    :param lines: the lines to decode.
+    :param backends: the backends to measure, all the available by default.
+    :param repeat: the number of measurements, the best one is reported.
+
+    :return: an ordered dictionary of lines per second per backend.
+
+    """
+    if backends is None:
+        backends = available_backends()
+
+    result = OrderedDict()
+    for name in backends:
+        loads_ = BACKENDS[name]()
+
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            for line in lines:
+                loads_(line)
+            elapsed = time.perf_counter() - start
+
+            best = elapsed if best is None else min(best, elapsed)
+
+        result[name] = len(lines) / best if best else float('inf')
+
+    return result
+
+
+def _set_environment_backend():
+    """Select the backend named by the environment variable.
+
+    An unknown name is not an error, so that the module can still be
+    imported, the fastest installed backend is used instead.
+
+    """
+    name = os.environ.get(ENVIRONMENT_VARIABLE, 'auto')
+    try:
+        return set_backend(name)
+    except ValueError:
+        logger.warning('Unknown json backend %r in %s, using auto.', name, ENVIRONMENT_VARIABLE)
+        return set_backend()
+
+
+_set_environment_backend()
@@ -1,8 +1,15 @@
 """Commands for manipulating local tweet collection."""
 
+import functools
+import logging
+import os
 import sys
 
-from poultry import consumers, options
+from poultry import compression, consumers, dedup, jsonlib, matchers, options, parallel, sketches, vocabulary, writers
+from poultry.tweet import Tweet
+from poultry.utils import get_file_names
+
+logger = logging.getLogger(__name__)
 
 dispatcher = options.Dispatcher()
 command = dispatcher.command
@@ -14,9 +21,46 @@ dispatch = dispatcher.dispatch
 @command()
 def group(producer,
           file_name_template=('t', '%Y-%m-%d-%H.gz', ''),
+          max_open_files=('', 32, 'The maximal number of files to keep open.'),
+          compression_level=('', 6, 'The compression level, for gzip from 1 (fast) to 9 (small).'),
+          threads=('', 2, 'The number of threads that compress the files, 0 to compress in the main thread.'),
+          dictionary=('', '', 'A Zstandard dictionary to compress .zst files in blocks with.'),
+          jobs=('j', 1, 'The number of processes that read the input files.'),
+          id_index=('', '', 'An id index of the tweets to skip, the ids of new tweets are added to it.'),
           ):
     """Group tweets to files by date according to the template."""
-    producer(consumers.to_tweet(consumers.group(file_name_template)))
+    build = functools.partial(
+        _group_target,
+        file_name_template=file_name_template,
+        max_open_files=max_open_files,
+        compression_level=compression_level,
+        dictionary=_read_dictionary(dictionary),
+    )
+
+    file_names = _shards(producer, jobs, id_index)
+    if file_names is not None:
+        parallel.run(build, producer, file_names, jobs, threads=threads)
+        return
+
+    writer_threads = writers.WriterThreads(threads) if threads > 0 else None
+    ids = dedup.IdIndex(id_index) if id_index else None
+
+    try:
+        producer(build(threads=writer_threads, ids=ids), binary=True)
+    finally:
+        if writer_threads is not None:
+            writer_threads.join()
+
+        if ids is not None:
+            ids.close()
+
+
+def _group_target(file_name_template, rename=None, on_open=print, ids=None, **kwargs):
+    target = consumers.group(file_name_template, rename=rename, on_open=on_open, **kwargs)
+    if ids is not None:
+        target = consumers.uniq(target, ids=ids)
+
+    return consumers.to_tweet(target, fields=('created_at', 'id'))
 
 
 @command()
@@ -32,7 +76,7 @@ def show(
 @command()
 def select(producer, output):
     """Print tweets as it is returned by the Twitter streaming API."""
-    producer(consumers.print_(output=output))
+    producer(consumers.print_(output=output), binary=True)
 
 
 @command()
@@ -59,48 +103,276 @@ def filter(
     producer, config, output,
     mode=('', u'a', 'The mode to open the files, `a` to append and `w` to rewrite.'),
     filters=('', [], 'The filters to use.'),
+    max_open_files=('', 32, 'The maximal number of files to keep open, shared by the filters and the dustbin.'),
+    compression_level=('', 6, 'The compression level, for gzip from 1 (fast) to 9 (small).'),
+    threads=('', 2, 'The number of threads that compress the files, 0 to compress in the main thread.'),
+    dictionary=('', '', 'A Zstandard dictionary to compress .zst files in blocks with.'),
+    jobs=('j', 1, 'The number of processes that read the input files.'),
+    id_index=('', '', 'An id index of the tweets to skip, the ids of new tweets are added to it.'),
 ):
     """Filter the tweets to files by filtering predicates defined in the configuration file."""
-    dustbin_template = config.dustbin_template
-    dustbin = consumers.group(dustbin_template) if dustbin_template is not None else None
-
-    filters_to_include = config.filters
+    filters_to_include = list(config.filters)
     if filters:
-        filters_to_include = (f for f in config.filters if f.name in filters)
+        filters_to_include = [f for f in filters_to_include if f.name in filters]
+
+    build = functools.partial(
+        _filter_target,
+        filters=filters_to_include,
+        dustbin_template=config.dustbin_template,
+        max_open_files=max_open_files,
+        compression_level=compression_level,
+        dictionary=_read_dictionary(dictionary),
+    )
+
+    # The tweets printed to the standard output can't be split to parts.
+    file_names = None
+    if all(f.split_template != '--' for f in filters_to_include):
+        file_names = _shards(producer, jobs, id_index)
+
+    if file_names is not None:
+        statistics = parallel.run(
+            functools.partial(_filter_job, build), producer, file_names, jobs, mode=mode, threads=threads,
+        )
+        matchers.log_statistics(matchers.merge_statistics(statistics))
+        return
+
+    # The files of all the filters are written by the same threads.
+    writer_threads = writers.WriterThreads(threads) if threads > 0 else None
+    ids = dedup.IdIndex(id_index) if id_index else None
+
+    target, matcher = build(threads=writer_threads, mode=mode, output=output, ids=ids)
+    try:
+        producer(target, binary=True)
+    finally:
+        if writer_threads is not None:
+            writer_threads.join()
+
+        if ids is not None:
+            ids.close()
+
+        matcher.log_statistics()
+
+
+def _filter_target(
+    filters, dustbin_template, mode='a', output=None, rename=None, on_open=print, ids=None, max_open_files=32,
+    **kwargs
+):
+    """The filtering pipeline and its matcher."""
+    # Each file target has its own pool, the limit is divided between them,
+    # so that the number of open files and their buffers stays bounded.
+    targets = sum(f.split_template != '--' for f in filters) + (dustbin_template is not None)
+    max_open_files = max(1, max_open_files // max(1, targets))
+
+    def record(target):
+        # Only the ids of the written tweets are added to the index.
+        return consumers.record_ids(target, ids) if ids is not None else target
+
+    def group(template, mode='a'):
+        return record(
+            consumers.group(
+                template, mode=mode, rename=rename, on_open=on_open, max_open_files=max_open_files, **kwargs
+            )
+        )
+
+    dustbin = group(dustbin_template) if dustbin_template is not None else None
 
     streams = tuple(
         (
-            consumers.group(f.split_template, mode=mode)
+            group(f.split_template, mode=mode)
             if f.split_template != '--'
-            else consumers.show(output=output, template='{t.raw}'),
-            lambda c, _, f=f: c.filter(**f.predicates),
+            else record(consumers.print_(output=output, template='{}')),
+            f.compile(),
         )
-        for f in filters_to_include
+        for f in filters
+    )
+    matcher = matchers.FilterSet(
+        (m for _, m in streams),
+        names=(f.name for f in filters),
     )
-    target = consumers.filter(streams, dustbin)
+    target = consumers.filter(streams, dustbin, matcher=matcher)
+    if ids is not None:
+        target = consumers.uniq(target, ids=ids, remember=False)
+    target = consumers.to_tweet(target)
+
+    # Lines that don't match go to the dustbin, so they can't be dropped.
+    prefilter = matchers.RawPrefilter.from_matchers(matcher.matchers) if dustbin is None else None
+    if prefilter is not None:
+        logger.debug('Prefiltering lines by: %s.', b', '.join(sorted(prefilter.needles)).decode('ascii'))
+        target = consumers.prefilter(target, prefilter)
+
+    return target, matcher
+
+
+def _filter_job(build, *args, **kwargs):
+    """The target of a parallel job and a function that gives the statistics of its matcher."""
+    target, matcher = build(*args, **kwargs)
+    return target, matcher.statistics
+
+
+@command()
+def uniq(
+    producer, output,
+    mode=('m', 'set', 'How to remember the seen ids: set, window or bloom.'),
+    window=('w', 24, 'The time window in hours, for the window mode.'),
+    memory=('', 256, 'The size of the Bloom filter in MiB, for the bloom mode.'),
+    error_rate=('', 1e-6, 'The false positive rate of the Bloom filter, for the bloom mode.'),
+    id_index=('', '', 'An id index of the tweets to skip, used instead of the mode.'),
+):
+    """Omit repeated tweets.
+
+    The set mode remembers all the ids. The window mode forgets the ids of
+    the tweets created more than the window before the newest one. The
+    bloom mode uses a fixed amount of memory, but may omit a tweet that is
+    not repeated. An id index keeps the ids between runs.
 
-    producer(consumers.to_tweet(target))
+    """
+    if id_index:
+        ids = dedup.IdIndex(id_index)
+    elif mode == 'set':
+        ids = set()
+    elif mode == 'window':
+        ids = dedup.SlidingWindow(window=window * 3600)
+    elif mode == 'bloom':
+        ids = dedup.BloomFilter.for_memory(memory * 2 ** 20, error_rate=error_rate)
+    else:
+        raise ValueError('Unknown mode {!r}, use one of: set, window, bloom.'.format(mode))
+
+    try:
+        producer(
+            consumers.to_tweet(
+                consumers.uniq(consumers.print_(output=output, template='{}'), ids=ids),
+                fields=('id', ),
+            ),
+            binary=True,
+        )
+    finally:
+        if id_index:
+            ids.close()
+
+
+@command()
+def index_ids(
+    producer,
+    id_index=('i', 'ids.index', 'The id index file.'),
+):
+    """Add the ids of the tweets to an id index."""
+    with dedup.IdIndex(id_index) as ids:
+        producer(
+            consumers.to_tweet(consumers.uniq(consumers.nop(), ids=ids), fields=('id', )),
+            binary=True,
+        )
+        ids.compact()
 
 
 @command()
-def uniq(producer):
-    """Omit repeated tweets."""
+def timeline(
+    producer,
+    window=('w', '%Y-%m-%d-%H', ''),
+    distinct=('d', '', 'Count distinct values of a tweet property, e.g. user_id, hashtags or retweeted_status.'),
+    precision=('', 12, 'The precision of the distinct counts, see HyperLogLog.'),
+    sketch_file=('', '', 'A file to keep the distinct count sketches in, sketches of earlier runs are merged.'),
+):
+    """Count the number of tweets per window.
+
+    With the distinct option, the number of distinct values per window is
+    estimated with the standard error of 1.6% for the default precision.
+    The estimates of different sources are combined by passing the same
+    sketch file.
+
+    """
+    if not distinct:
+        producer(
+            consumers.to_tweet(
+                consumers.timeline(
+                    window=window,
+                    target=consumers.counter_printer(sys.stdout),
+                ),
+                fields=('created_at', 'id'),
+            ),
+        )
+        return
+
+    if not isinstance(getattr(Tweet, distinct, None), property):
+        raise ValueError('Unknown tweet property {!r}.'.format(distinct))
+
+    distinct_sketches = {}
+    if sketch_file and os.path.exists(sketch_file):
+        with open(sketch_file, 'rb') as f:
+            distinct_sketches = sketches.load_sketches(f)
+
     producer(
         consumers.to_tweet(
-            consumers.uniq(consumers.select())
+            consumers.distinct(
+                distinct_sketches,
+                provider=functools.partial(_distinct_values, distinct),
+                window=window,
+                precision=precision,
+            ),
+            fields=('created_at', 'id', distinct),
         ),
     )
 
+    if sketch_file:
+        with open(sketch_file, 'wb') as f:
+            sketches.save_sketches(distinct_sketches, f)
+
+    consumers.counter_printer(sys.stdout).send(
+        {name: sketch.count() for name, sketch in distinct_sketches.items()}
+    )
+
+
+def _distinct_values(name, tweet):
+    """The values of a tweet property.
+
+    The elements of a collection are counted one by one, a retweeted tweet
+    is represented by its id and other values by their strings.
+
+    """
+    value = getattr(tweet, name)
+
+    if value is None:
+        return ()
+    if isinstance(value, Tweet):
+        return value.id,
+    if isinstance(value, (str, int)):
+        return value,
+    if isinstance(value, (list, set, frozenset)):
+        return [v if isinstance(v, (str, int)) else str(v) for v in value]
+
+    return str(value),
+
 
 @command()
-def timeline(producer, window=('w', '%Y-%m-%d-%H', '')):
-    """Count the number of tweets per window."""
+def top(
+    producer,
+    k=('k', 10, 'The number of the most frequent tokens to show.'),
+    memory=('', 64, 'The memory budget of the counter in MiB.'),
+    sketch=('', 'space-saving', 'The counter: space-saving, count-min or exact.'),
+):
+    """Show the most frequent tokens and hashtags.
+
+    The counts are approximate and never lower than the real ones. The
+    space-saving counter remembers as many tokens as fit to the memory, the
+    count-min sketch estimates the counts of all the tokens. The exact
+    counter keeps all the tokens in a compact vocabulary, the memory option
+    does not apply to it.
+
+    """
+    size = memory * 2 ** 20
+    if sketch == 'space-saving':
+        factory = functools.partial(sketches.SpaceSaving.for_memory, size)
+    elif sketch == 'count-min':
+        factory = functools.partial(sketches.CountMinSketch.for_memory, size, k=k)
+    elif sketch == 'exact':
+        factory = vocabulary.Vocabulary
+    else:
+        raise ValueError('Unknown sketch {!r}, use one of: space-saving, count-min, exact.'.format(sketch))
 
     producer(
         consumers.to_tweet(
-            consumers.timeline(
-                window=window,
-                target=consumers.counter_printer(sys.stdout),
+            consumers.count_tokens(
+                factory=factory,
+                target=consumers.top_printer(sys.stdout, k=k),
             ),
         ),
     )
@@ -114,3 +386,59 @@ def media(producer, output):
             consumers.print_media(output=output)
         )
     )
+
+
+@command()
+def json_benchmark(
+    producer,
+    output,
+    repeat=('r', 3, 'The number of measurements per backend.'),
+):
+    """Report json decoding speed (lines per second) of the available backends."""
+    lines = []
+    producer(consumers.collect(lines))
+
+    for name, speed in jsonlib.benchmark(lines, repeat=repeat).items():
+        output.write(u'{} {:.0f}\n'.format(name, speed))
+
+
+@command()
+def train_dict(
+    producer,
+    file_name=('f', 'tweets.zdict', 'The file to write the dictionary to.'),
+    size=('', 2 ** 17, 'The maximal size of the dictionary in bytes.'),
+    samples=('', 100000, 'The number of tweets to train the dictionary on.'),
+):
+    """Train a Zstandard dictionary to compress the tweets with."""
+    lines = []
+    producer(consumers.sample(lines, samples), binary=True)
+
+    dictionary = compression.train_dictionary(lines, size=size)
+
+    with open(file_name, 'wb') as f:
+        f.write(dictionary)
+
+
+def _read_dictionary(file_name):
+    if not file_name:
+        return None
+
+    with open(file_name, 'rb') as f:
+        return f.read()
+
+
+def _shards(producer, jobs, id_index=None):
+    """The input files to process in parallel, `None` to process them serially."""
+    if jobs < 2:
+        return None
+
+    if id_index:
+        logger.warning('An id index is used by one process at a time, processing the files serially.')
+        return None
+
+    source = producer.keywords['source']
+    if not source or source.startswith('twitter://'):
+        logger.warning('Only files can be processed in parallel, reading %s serially.', source or 'stdin')
+        return None
+
+    return list(get_file_names(source))
@@ -0,0 +1,686 @@
+"""Compiled filtering predicates."""
+import logging
+import math
+import re
+
+from collections import OrderedDict, defaultdict
+from time import perf_counter
+
+
+logger = logging.getLogger(__name__)
+
+
+class Matcher(object):
+    """Filtering predicates compiled to match tweets.
+
+    The predicates are normalized once: follow ids are converted to
+    integers, track phrases are lowercased. Instances are immutable and
+    callable, so they can be used as `consumers.filter` predicates.
+
+    A tweet matches if it is created in the date range, at least one of
+    the main predicates (`follow`, `track` or `locations`) is satisfied
+    (or none of them is given) and its language is one of `language` (if
+    it is given).
+
+    Mimics Twitter `statuses/filter`_ method of the Streaming API.
+
+    .. _statuses/filter: https://dev.twitter.com/docs/streaming-api/methods#statuses-filter
+
+    """
+    __slots__ = 'follow', 'track', 'locations', 'language', 'start_date', 'end_date'
+
+    def __init__(self, follow=None, track=None, locations=None, language=None,
+                 start_date=None, end_date=None):
+        set_ = super(Matcher, self).__setattr__
+
+        set_('follow', frozenset(int(f) for f in follow or ()))
+        set_('track', tuple(sorted(set(t.lower() for t in track or ()))))
+        set_('locations', tuple(sorted(set(locations or ()))))
+        set_('language', frozenset(language or ()))
+        set_('start_date', start_date)
+        set_('end_date', end_date)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Can't set {!r}, {} is immutable.".format(name, type(self).__name__))
+
+    def __delattr__(self, name):
+        raise AttributeError("Can't delete {!r}, {} is immutable.".format(name, type(self).__name__))
+
+    def __call__(self, tweet, first=None):
+        return self.match(tweet)
+
+    def __repr__(self):
+        return (
+            '<{s.__class__.__name__}('
+            'follow={s.follow!r}, '
+            'track={s.track!r}, '
+            'locations={s.locations!r}, '
+            'language={s.language!r}, '
+            'start_date={s.start_date!r}, '
+            'end_date={s.end_date!r}'
+            ')>'.format(s=self)
+        )
+
+    def match(self, tweet):
+        """Match the predicates to the tweet.
+
+        :return: `True` if there is a match, `False` otherwise.
+
+        """
+        if self.start_date is not None and tweet.created_at < self.start_date:
+            return False
+
+        if self.end_date is not None and self.end_date < tweet.created_at:
+            return False
+
+        if self.follow or self.track or self.locations:
+            matched = (
+                self.match_follow(tweet) or
+                self.match_track(tweet) or
+                self.match_locations(tweet)
+            )
+            if not matched:
+                return False
+
+        return self.match_language(tweet)
+
+    def match_follow(self, tweet):
+        """Whether the tweet is created by or mentions a followed user."""
+        if not self.follow:
+            return False
+
+        return tweet.user_id in self.follow or not self.follow.isdisjoint(tweet.user_mention_ids)
+
+    def match_track(self, tweet):
+        """Whether the tweet's text contains a tracked phrase, case insensitively."""
+        if not self.track:
+            return False
+
+        text = tweet.text.lower()
+        return any(t in text for t in self.track)
+
+    def match_locations(self, tweet):
+        """Whether the tweet's coordinates are in one of the locations.
+
+        The South-West point of tweet's place is used if its coordinate is
+        not provided.
+
+        """
+        if not self.locations:
+            return False
+
+        coor = tweet.coordinates
+        if not coor:
+            return False
+
+        lon, lat = coor.lon, coor.lat
+        return any(
+            sw[0] <= lon <= ne[0] and sw[1] <= lat <= ne[1]
+            for sw, ne in self.locations
+        )
+
+    def match_language(self, tweet):
+        """Whether the tweet is written in one of the languages."""
+        return not self.language or tweet.lang in self.language
+
+
+class TrackIndex(object):
+    """An Aho-Corasick automaton that finds tracked phrases in a text.
+
+    :param phrases: a mapping from a phrase to the labels (for example, filter
+                    indices) it belongs to.
+    :param scan_threshold: the maximal number of phrases that are scanned
+                           one by one.
+
+    All the phrases are searched in one pass over the text. If there are
+    only a few phrases, the text is simply scanned for each of them, as it
+    is faster.
+
+    >>> phrases = {'pop': {1}, 'pinkpop': {2}, 'punk': {3}}
+    >>> sorted(TrackIndex(phrases).search('pinkpop and pukkelpop'))
+    [1, 2]
+    >>> index = TrackIndex(phrases, scan_threshold=0)
+    >>> sorted(index.search('pinkpop and pukkelpop'))
+    [1, 2]
+
+    """
+
+    def __init__(self, phrases, scan_threshold=64):
+        self._phrases = None
+        if len(phrases) <= scan_threshold:
+            self._phrases = tuple((p, frozenset(l)) for p, l in phrases.items())
+            return
+
+        goto = [{}]
+        outputs = [set()]
+        always = set()
+
+        for phrase, labels in phrases.items():
+            if not phrase:
+                # The empty phrase is in every text.
+                always.update(labels)
+                continue
+
+            node = 0
+            for c in phrase:
+                next_node = goto[node].get(c)
+                if next_node is None:
+                    next_node = len(goto)
+                    goto[node][c] = next_node
+                    goto.append({})
+                    outputs.append(set())
+                node = next_node
+
+            outputs[node].update(labels)
+
+        # Breadth first traversal to compute failure links and to merge the
+        # outputs of the nodes that are suffixes of each other.
+        fail = [0] * len(goto)
+        queue = list(goto[0].values())
+        for node in queue:
+            for c, child in goto[node].items():
+                state = fail[node]
+                while state and c not in goto[state]:
+                    state = fail[state]
+                fail[child] = goto[state].get(c, 0)
+                outputs[child].update(outputs[fail[child]])
+                queue.append(child)
+
+        self._goto = goto
+        self._fail = fail
+        self._outputs = [frozenset(o) for o in outputs]
+        self._always = frozenset(always)
+
+    def search(self, text):
+        """The labels of the phrases that occur in the text."""
+        if self._phrases is not None:
+            result = set()
+            for phrase, labels in self._phrases:
+                if phrase in text:
+                    result.update(labels)
+            return result
+
+        goto = self._goto
+        fail = self._fail
+        outputs = self._outputs
+
+        result = set(self._always)
+        node = 0
+        for c in text:
+            next_node = goto[node].get(c)
+            while next_node is None and node:
+                node = fail[node]
+                next_node = goto[node].get(c)
+            node = next_node or 0
+
+            if outputs[node]:
+                result.update(outputs[node])
+
+        return result
+
+
+class LocationIndex(object):
+    """A uniform grid index of location boxes.
+
+    :param boxes: a mapping from a box, a pair of the South-West and the
+                  North-East `(lon, lat)` points, to the labels (for example,
+                  filter indices) it belongs to.
+    :param cell_size: the size of a grid cell in degrees.
+    :param max_cells: the boxes that span more cells than this are not put
+                      to the grid, they are checked for every query.
+
+    The box borders belong to the box.
+
+    >>> index = LocationIndex({((0, 0), (2, 2)): {1}, ((1, 1), (3, 3)): {2}})
+    >>> sorted(index.query_point(1.5, 1.5))
+    [1, 2]
+    >>> sorted(index.query_point(3, 3))
+    [2]
+    >>> sorted(index.query_box((2.5, -1), (5, 0.5)))
+    []
+    >>> sorted(index.query_box((2.5, -1), (5, 1.5)))
+    [2]
+
+    """
+
+    def __init__(self, boxes, cell_size=1.0, max_cells=4096):
+        self.cell_size = cell_size
+        self.max_cells = max_cells
+
+        self._boxes = tuple((box, frozenset(labels)) for box, labels in boxes.items())
+        self._cells = defaultdict(list)
+        self._large = []
+
+        for entry in self._boxes:
+            (sw_lon, sw_lat), (ne_lon, ne_lat) = entry[0]
+
+            cells = self._cells_in(sw_lon, sw_lat, ne_lon, ne_lat)
+            if cells is None:
+                self._large.append(entry)
+                continue
+
+            for cell in cells:
+                self._cells[cell].append(entry)
+
+        self._cells = dict(self._cells)
+
+    def _cell(self, value):
+        return int(math.floor(value / self.cell_size))
+
+    def _cells_in(self, sw_lon, sw_lat, ne_lon, ne_lat):
+        """The cells a box spans, `None` if there are too many of them."""
+        try:
+            lon_range = range(self._cell(sw_lon), self._cell(ne_lon) + 1)
+            lat_range = range(self._cell(sw_lat), self._cell(ne_lat) + 1)
+        except (ValueError, OverflowError):
+            # Not finite coordinates.
+            return None
+
+        if len(lon_range) * len(lat_range) > self.max_cells:
+            return None
+
+        return [(i, j) for i in lon_range for j in lat_range]
+
+    def query_point(self, lon, lat):
+        """The labels of the boxes that contain the point."""
+        try:
+            candidates = self._cells.get((self._cell(lon), self._cell(lat)), [])
+        except (ValueError, OverflowError):
+            candidates = self._boxes
+
+        result = set()
+        for entries in candidates, self._large:
+            for ((sw_lon, sw_lat), (ne_lon, ne_lat)), labels in entries:
+                if sw_lon <= lon <= ne_lon and sw_lat <= lat <= ne_lat:
+                    result.update(labels)
+
+        return result
+
+    def query_box(self, sw, ne):
+        """The labels of the boxes that intersect the box.
+
+        It can be used to match the bounding box of tweet's place.
+
+        """
+        (sw_lon, sw_lat), (ne_lon, ne_lat) = sw, ne
+
+        cells = self._cells_in(sw_lon, sw_lat, ne_lon, ne_lat)
+        if cells is None:
+            candidates = self._boxes
+        else:
+            candidates = set()
+            for cell in cells:
+                candidates.update(self._cells.get(cell, ()))
+            candidates.update(self._large)
+
+        result = set()
+        for ((b_sw_lon, b_sw_lat), (b_ne_lon, b_ne_lat)), labels in candidates:
+            if not (
+                b_sw_lon > ne_lon or b_ne_lon < sw_lon or
+                b_sw_lat > ne_lat or b_ne_lat < sw_lat
+            ):
+                result.update(labels)
+
+        return result
+
+
+class FilterSet(object):
+    """Several matchers evaluated together.
+
+    The predicates the matchers share are evaluated once per tweet: the
+    track phrases of all the matchers are searched in one pass over the
+    lowercased text, see :class:`TrackIndex`, tweet's coordinates are
+    looked up in a grid of all the locations, see :class:`LocationIndex`,
+    and the author and the mentioned users are looked up in an index from
+    user ids to the matchers that follow them. The result is the same as if
+    each matcher was applied in turn.
+
+    The order in which the predicates of a matcher are evaluated adapts to
+    the stream. The cost and the selectivity of each predicate are measured
+    at runtime and every `reorder_every` tweets cheap and selective
+    predicates (the dates, the language and the main predicates together)
+    are moved forward, as are cheap and likely main predicates (`follow`,
+    `track` and `locations`), which are ORed. Use :meth:`log_statistics`
+    to see the measurements.
+
+    :param matchers: a sequence of :class:`Matcher` objects.
+    :param names: the names of the matchers to use in the statistics.
+    :param reorder_every: how often, in tweets, the predicates are reordered.
+
+    """
+
+    def __init__(self, matchers, names=None, reorder_every=1000):
+        self.matchers = tuple(matchers)
+        self.names = tuple(names) if names is not None else tuple(str(i) for i in range(len(self.matchers)))
+        self.reorder_every = reorder_every
+
+        phrases = defaultdict(set)
+        for i, matcher in enumerate(self.matchers):
+            for phrase in matcher.track:
+                phrases[phrase].add(i)
+
+        self.track_index = TrackIndex(phrases)
+
+        boxes = defaultdict(set)
+        for i, matcher in enumerate(self.matchers):
+            for box in matcher.locations:
+                boxes[box].add(i)
+
+        self.location_index = LocationIndex(boxes)
+
+        follow_index = defaultdict(set)
+        for i, matcher in enumerate(self.matchers):
+            for user_id in matcher.follow:
+                follow_index[user_id].add(i)
+
+        self.follow_index = {u: frozenset(i) for u, i in follow_index.items()}
+
+        self._plans = [self._plan(i, m) for i, m in enumerate(self.matchers)]
+        self._matched = 0
+
+    def __call__(self, tweet):
+        return self.match(tweet)
+
+    def match(self, tweet):
+        """The indices of the matchers that match the tweet, in order."""
+        self._matched += 1
+        if self._matched % self.reorder_every == 0:
+            self._reorder()
+
+        shared = {}
+        return [
+            i for i, plan in enumerate(self._plans)
+            if all(predicate(tweet, shared) for predicate in plan)
+        ]
+
+    def _plan(self, i, matcher):
+        """The list of ANDed predicates of a matcher."""
+        plan = []
+
+        if matcher.start_date is not None:
+            plan.append(
+                _Predicate('start_date', lambda tweet, _: not tweet.created_at < matcher.start_date)
+            )
+
+        if matcher.end_date is not None:
+            plan.append(
+                _Predicate('end_date', lambda tweet, _: not matcher.end_date < tweet.created_at)
+            )
+
+        if matcher.language:
+            plan.append(_Predicate('language', lambda tweet, _: matcher.match_language(tweet)))
+
+        main = []
+        if matcher.follow:
+            main.append(_Predicate('follow', lambda tweet, shared: i in self._followed(tweet, shared)))
+
+        if matcher.locations:
+            main.append(_Predicate('locations', lambda tweet, shared: i in self._located(tweet, shared)))
+
+        if matcher.track:
+            main.append(_Predicate('track', lambda tweet, shared: i in self._tracked(tweet, shared)))
+
+        if main:
+            plan.append(_Disjunction('main', main))
+
+        return plan
+
+    def _reorder(self):
+        for plan in self._plans:
+            for predicate in plan:
+                if isinstance(predicate, _Disjunction):
+                    predicate.predicates.sort(key=lambda p: p.cost / p.pass_rate)
+
+            plan.sort(key=lambda p: p.cost / (1 - p.pass_rate))
+
+    def _followed(self, tweet, shared):
+        """The indices of the matchers that follow the author or the mentioned users."""
+        try:
+            return shared['follow']
+        except KeyError:
+            pass
+
+        follow_index = self.follow_index
+
+        result = set(follow_index.get(tweet.user_id, ()))
+        for user_id in tweet.user_mention_ids:
+            result.update(follow_index.get(user_id, ()))
+
+        shared['follow'] = result
+        return result
+
+    def _tracked(self, tweet, shared):
+        """The indices of the matchers that track a phrase in the text."""
+        try:
+            return shared['track']
+        except KeyError:
+            result = shared['track'] = self.track_index.search(tweet.text.lower())
+            return result
+
+    def _located(self, tweet, shared):
+        """The indices of the matchers whose locations contain the tweet."""
+        try:
+            return shared['locations']
+        except KeyError:
+            pass
+
+        coor = tweet.coordinates
+        result = shared['locations'] = self.location_index.query_point(coor.lon, coor.lat) if coor else set()
+        return result
+
+    def statistics(self):
+        """The runtime statistics of the predicates.
+
+        :return: a list of `(matcher name, predicate name, evaluations,
+                 passed, average cost in seconds)` tuples, in the current
+                 evaluation order.
+
+        """
+        result = []
+        for name, plan in zip(self.names, self._plans):
+            for predicate in plan:
+                for p in [predicate] + getattr(predicate, 'predicates', []):
+                    result.append((name, p.name, p.evaluations, p.passed, p.cost))
+
+        return result
+
+    def log_statistics(self):
+        """Log the runtime statistics of the predicates at the debug level."""
+        log_statistics(self.statistics())
+
+
+def merge_statistics(statistics):
+    """Merge the statistics of several :meth:`FilterSet.statistics` calls.
+
+    The evaluations and the passes of a predicate are summed, its cost is
+    averaged over the evaluations.
+
+    >>> merge_statistics([
+    ...     [('pinkpop', 'track', 1, 1, 2.0)],
+    ...     [('pinkpop', 'track', 3, 0, 1.0), ('pinkpop', 'language', 1, 1, 1.0)],
+    ... ])
+    [('pinkpop', 'track', 4, 1, 1.25), ('pinkpop', 'language', 1, 1, 1.0)]
+
+    """
+    merged = OrderedDict()
+    for rows in statistics:
+        for name, predicate, evaluations, passed, cost in rows:
+            total = merged.setdefault((name, predicate), [0, 0, 0.0])
+            total[0] += evaluations
+            total[1] += passed
+            total[2] += cost * evaluations
+
+    return [
+        (name, predicate, evaluations, passed, time / evaluations if evaluations else 0.0)
+        for (name, predicate), (evaluations, passed, time) in merged.items()
+    ]
+
+
+def log_statistics(statistics):
+    """Log the statistics given by :meth:`FilterSet.statistics` at the debug level."""
+    for name, predicate, evaluations, passed, cost in statistics:
+        logger.debug(
+            '%s %s: %s evaluations, %s passed, %.2f us per evaluation.',
+            name, predicate, evaluations, passed, cost * 1e6,
+        )
+
+
+class _Predicate(object):
+    """A predicate that keeps track of its cost and selectivity.
+
+    The time is measured for one of `timing_sample` evaluations.
+
+    """
+    __slots__ = 'name', 'func', 'evaluations', 'passed', 'timed', 'time'
+
+    timing_sample = 16
+
+    def __init__(self, name, func):
+        self.name = name
+        self.func = func
+
+        self.evaluations = 0
+        self.passed = 0
+        self.timed = 0
+        self.time = 0.0
+
+    def __call__(self, tweet, shared):
+        self.evaluations += 1
+
+        if self.evaluations % self.timing_sample == 1:
+            start = perf_counter()
+            result = self.func(tweet, shared)
+            self.time += perf_counter() - start
+            self.timed += 1
+        else:
+            result = self.func(tweet, shared)
+
+        if result:
+            self.passed += 1
+
+        return result
+
+    @property
+    def cost(self):
+        """The average evaluation time in seconds."""
+        return self.time / self.timed if self.timed else 0.0
+
+    @property
+    def pass_rate(self):
+        """The smoothed share of the evaluations that were true."""
+        return (self.passed + 1.0) / (self.evaluations + 2.0)
+
+
+class _Disjunction(_Predicate):
+    """ORed predicates."""
+    __slots__ = 'predicates',
+
+    def __init__(self, name, predicates):
+        super(_Disjunction, self).__init__(name, self._any)
+        self.predicates = predicates
+
+    def _any(self, tweet, shared):
+        return any(p(tweet, shared) for p in self.predicates)
+
+
+class RawPrefilter(object):
+    r"""A conservative test whether an undecoded line may contain tracked phrases.
+
+    For each phrase, the longest run of characters that always appear
+    literally in the json encoded text is chosen as a needle. Lines that
+    contain none of the needles, case insensitively, can't match and are
+    rejected before they are decoded.
+
+    The needles are made of ASCII letters and digits. Lines that may hide
+    them are always accepted: the lines with escaped ASCII letters or
+    digits (for example ``\u0041``) and the lines with ``\u0130`` or
+    ``\u212a``, which are lowercased to ``i`` and ``k``.
+
+    :param phrases: lowercased tracked phrases.
+    :param scan_threshold: the maximal number of needles that are scanned
+                           one by one, a regular expression is used for
+                           more.
+
+    >>> prefilter = RawPrefilter(['pinkpop', 'pop', '#pygrunn'])
+    >>> sorted(prefilter.needles)
+    [b'pop', b'pygrunn']
+    >>> prefilter(b'{"text": "PinkPop!"}'), prefilter(b'{"text": "Pinkpunk"}')
+    (True, False)
+    >>> prefilter(b'{"text": "Pinkp\\u006fp"}'), prefilter(b'{"text": "\\u003cPinkpunk"}')
+    (True, False)
+
+    Phrases without a needle can't be prefiltered.
+
+    >>> RawPrefilter([':-)'])
+    Traceback (most recent call last):
+    ...
+    ValueError: No needle for ':-)'.
+
+    """
+
+    def __init__(self, phrases, scan_threshold=8):
+        needles = set()
+        for phrase in phrases:
+            runs = _NEEDLE_RUN.findall(phrase)
+            if not runs:
+                raise ValueError('No needle for {!r}.'.format(phrase))
+
+            needles.add(max(runs, key=len).encode('ascii'))
+
+        # A line that contains a needle also contains all its superstrings.
+        self.needles = frozenset(
+            n for n in needles
+            if not any(o != n and o in n for o in needles)
+        )
+
+        self._regex = None
+        if len(self.needles) > scan_threshold:
+            self._regex = re.compile(b'|'.join(re.escape(n) for n in sorted(self.needles)))
+
+    @classmethod
+    def from_matchers(cls, matchers):
+        """A prefilter for a line to match any of the matchers.
+
+        `None` is returned if the matchers can't be prefiltered, that is
+        if any of them is not made only of `track` phrases (dates and
+        language are fine) or a phrase has no needle.
+
+        """
+        phrases = set()
+        for matcher in matchers:
+            if matcher.follow or matcher.locations or not matcher.track:
+                return None
+            phrases.update(matcher.track)
+
+        try:
+            return cls(phrases)
+        except ValueError:
+            return None
+
+    def __call__(self, line):
+        """Whether the line may match. Items other than lines are accepted."""
+        if isinstance(line, str):
+            line = line.encode('utf-8')
+        elif not isinstance(line, bytes):
+            return True
+
+        line = line.lower()
+
+        if _HIDDEN_ALNUM.search(line) is not None:
+            return True
+
+        if self._regex is not None:
+            return self._regex.search(line) is not None
+
+        for needle in self.needles:
+            if needle in line:
+                return True
+
+        return False
+
+
+_NEEDLE_RUN = re.compile('[0-9a-z]+')
+_HIDDEN_ALNUM = re.compile(
+    # Escaped ASCII letters and digits, U+0130 and U+212A escaped or in UTF-8.
+    br'\\u00(?:3[0-9]|[46][1-9a-f]|[57][0-9a])|\\u0130|\\u212a|\xc4\xb0|\xe2\x84\xaa'
+)
@@ -1,9 +1,11 @@
+import functools
 import inspect
 import logging
 import sys
 
 import opster
 
+from poultry import jsonlib
 from poultry.config import Config
 from poultry.producers import from_stream
 
@@ -21,6 +23,7 @@ class Dispatcher(opster.Dispatcher):
                 ('o', 'output',  '-', 'Output file, by default standartd output is used.'),
                 ('e', 'encoding', 'utf-8', 'Output file encoding.'),
                 ('', 'extract_retweets', False, 'Extract retweets'),
+                ('', 'json-backend', '', 'JSON backend: auto, orjson, ujson or json.'),
             )
         )
 
@@ -39,6 +42,7 @@ def _middleware(func):
         f_args = inspect.getargspec(func)[0]
 
         verbose = kwargs.pop('verbose')
+        json_backend = kwargs.pop('json_backend')
 
         config = kwargs['config'] = Config(kwargs.get('config'))
         if 'config' not in f_args:
@@ -46,7 +50,10 @@ def _middleware(func):
 
         source = kwargs.pop('source')
         extract_retweets = kwargs.pop('extract_retweets')
-        producer = lambda target: from_stream(target, source, config, extract_retweets=extract_retweets)
+        # A partial, not a lambda, so that it can be sent to other processes.
+        producer = functools.partial(
+            from_stream, source=source, config=config, extract_retweets=extract_retweets,
+        )
 
         if 'producer' in f_args:
             kwargs['producer'] = producer
@@ -63,6 +70,9 @@ def _middleware(func):
         else:
             logging.basicConfig(format='%(levelname)s:%(message)s', level=logging.CRITICAL)
 
+        if json_backend:
+            jsonlib.set_backend(json_backend)
+
         encoding = kwargs.pop('encoding')
         output = kwargs.pop('output')
 
@@ -0,0 +1,166 @@
+"""Processing input files in parallel.
+
+Each input file is processed by a worker process that writes its output to
+part files. The parts are then concatenated in the order of the input files,
+so the output is the same as if the files were processed one after another.
+Compressed streams (gzip members, Zstandard and LZ4 frames, bzip2 streams)
+can be concatenated, see :mod:`poultry.compression`.
+
+"""
+import logging
+import multiprocessing
+import os
+import shutil
+import tempfile
+
+from collections import OrderedDict
+
+from poultry import compression
+from poultry.writers import WriterThreads
+
+try:
+    from urllib.parse import quote
+except ImportError:
+    from urllib import quote
+
+
+logger = logging.getLogger(__name__)
+
+
+def run(build, producer, file_names, jobs, mode='a', on_open=print, threads=0):
+    """Process files in worker processes and combine their outputs.
+
+    :param build: a function that returns a target, see
+                  :func:`poultry.consumers.group` for its `rename`,
+                  `on_open`, `mode` and `threads` keyword arguments. The
+                  target must only write files named by `rename`, an output
+                  is combined in the mode it is first opened in by the
+                  target. `build` can also return a
+                  pair of a target and a function that is called after the
+                  file is processed and returns a picklable result.
+    :param producer: a producer, see :func:`poultry.producers.from_stream`,
+                     it is called with a file name as the `source`.
+    :param file_names: the input files.
+    :param jobs: the number of worker processes.
+    :param mode: the mode `build` is called with, ``a`` to append to the
+                 outputs and ``w`` to rewrite them.
+    :param on_open: a function that is called with a name of an output file
+                    when it is opened.
+    :param threads: the number of :class:`poultry.writers.WriterThreads` of
+                    a worker, 0 to write the files in the worker's main
+                    thread.
+
+    :return: the results of the input files in their order, ``None`` if
+             `build` returns only a target.
+
+    The functions must be picklable, for example :func:`functools.partial`
+    objects of module level functions.
+
+    """
+    # The parts are written next to the outputs, so that they can be moved.
+    work_dir = tempfile.mkdtemp(prefix='.poultry-', dir='.')
+
+    try:
+        tasks = [(build, producer, work_dir, mode, threads, i, f) for i, f in enumerate(file_names)]
+
+        pool = multiprocessing.Pool(jobs)
+        try:
+            done = pool.map(_process, tasks, chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+
+        modes = {}
+        for _, part_modes, _ in done:
+            for name, part_mode in part_modes.items():
+                modes.setdefault(name, part_mode)
+
+        combine([parts for parts, _, _ in done], mode=mode, on_open=on_open, modes=modes)
+    finally:
+        shutil.rmtree(work_dir)
+
+    return [result for _, _, result in done]
+
+
+def _process(task):
+    build, producer, work_dir, mode, threads, index, file_name = task
+    logger.debug('Processing %s.', file_name)
+
+    parts = {}
+    modes = {}
+
+    def rename(name, mode):
+        try:
+            return parts[name]
+        except KeyError:
+            modes[name] = mode.rstrip('b')
+            # The extension is kept, so that the part is compressed as the output.
+            part = parts[name] = os.path.join(work_dir, '{:06d}-{}'.format(index, quote(name, safe='')))
+            return part
+
+    writer_threads = WriterThreads(threads) if threads > 0 else None
+    try:
+        target = build(rename=rename, on_open=None, mode=mode, threads=writer_threads)
+        result = None
+        if isinstance(target, tuple):
+            target, result = target
+
+        producer(target, source=file_name, binary=True)
+    finally:
+        if writer_threads is not None:
+            writer_threads.join()
+
+    if result is not None:
+        result = result()
+
+    return parts, modes, result
+
+
+def combine(parts, mode='a', on_open=None, modes=None):
+    """Concatenate part files to output files.
+
+    :param parts: a list of dictionaries from an output file name to a part
+                  file name. The parts of an output are concatenated in the
+                  order of the list.
+    :param mode: the mode to open the output files, ``a`` to append and ``w``
+                 to rewrite.
+    :param modes: a dictionary from output file names to the modes to open
+                  them in, instead of `mode`.
+
+    Zstandard parts written with a dictionary start with the same
+    dictionary frame, the output keeps only the first one.
+
+    """
+    names = OrderedDict((n, None) for p in parts for n in p)
+
+    for name in names:
+        if on_open is not None:
+            on_open(name)
+
+        name_mode = (modes or {}).get(name, mode)
+
+        dictionary, empty = None, True
+        if name_mode == 'a' and os.path.exists(name) and os.path.getsize(name):
+            with open(name, 'rb') as f:
+                dictionary = compression._read_dictionary_frame(f)
+            empty = False
+
+        with open(name, '{}b'.format(name_mode)) as f:
+            for p in parts:
+                if name not in p:
+                    continue
+
+                with open(p[name], 'rb') as part:
+                    part_dictionary = compression._read_dictionary_frame(part)
+                    if part_dictionary is None or empty:
+                        part.seek(0)
+                    elif part_dictionary != dictionary:
+                        raise ValueError(
+                            "Can't append to {}, it is not compressed with the dictionary.".format(name)
+                        )
+
+                    if empty:
+                        dictionary = part_dictionary
+
+                    shutil.copyfileobj(part, f)
+                    empty = empty and f.tell() == 0
@@ -1,22 +1,27 @@
 import fileinput
 import contextlib
 
-from poultry import consumers
+from poultry import compression, consumers
 from poultry.stream import from_twitter_api
 from poultry.tweet import Tweet, TweetValueError
 from poultry.utils import get_file_names
 
 
-def consume_stream(target, input_dir=None):
+def consume_stream(target, input_dir=None, binary=False):
     """Read lines from the standard input or files in a directory.
 
     Behaves as a generator, should receive a .send() call to send a
     line to the target.
 
+    :param binary: if `True`, the lines are sent as they are read, as bytes,
+                   otherwise they are decoded from UTF-8.
+
     """
     file_names = get_file_names(input_dir) if input_dir else []
 
-    with contextlib.closing(fileinput.FileInput(file_names, openhook=fileinput.hook_compressed)) as lines:
+    with contextlib.closing(
+        fileinput.FileInput(file_names, mode='rb', openhook=compression.openhook)
+    ) as lines:
         targets = [target] if target is not None else []
         with consumers.closing(*targets):
 
@@ -24,7 +29,7 @@ def consume_stream(target, input_dir=None):
                 if not line.strip():
                     continue
 
-                if isinstance(line, bytes):
+                if not binary:
                     line = line.decode('utf-8')
 
                 if target is not None:
@@ -50,29 +55,31 @@ def readline_dir(input_dir, extract_retweets=False, mark_extracted=False):
             continue
         else:
 
-            # TODO: this duplicates consumers.extract_retweets.
-            retweeted_status = tweet.parsed.get('retweeted_status', None)
-            if extract_retweets and retweeted_status:
-                    yield Tweet(retweeted_status)
+            if extract_retweets:
+                retweeted_status = tweet.retweeted_status
+                if retweeted_status is not None:
+                    yield retweeted_status
+
             yield tweet
 
 
-def from_stream(target, source=None, config=None, extract_retweets=False):
+def from_stream(target, source=None, config=None, extract_retweets=False, binary=False):
     """Send lines from the standard input, the input directory or the Twitter Streaming API.
 
     :param target: a generator to which the read lines are sent.
     :param source: the path to a directory with tweet files.
     :param config: the config file
     :param extract_retweets: Extract retweets from the tweets.
+    :param binary: Send the lines as bytes, without decoding them.
 
     """
     if extract_retweets:
         target = consumers.extract_retweets(target)
 
     if source in ('twitter://sample', 'twitter://filter'):
-        consumer = from_twitter_api(target, source, config)
+        consumer = from_twitter_api(target, source, config, binary=binary)
     else:
-        consumer = consume_stream(target, source)
+        consumer = consume_stream(target, source, binary=binary)
 
         try:
             while True:
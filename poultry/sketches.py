@@ -0,0 +1,391 @@
+"""Approximate counters with a fixed memory budget.
+
+:class:`SpaceSaving` counts the most frequent items exactly enough to rank
+them, :class:`CountMinSketch` estimates the count of any item. Both can be
+used in place of a :class:`collections.Counter` by
+:func:`poultry.consumers.count` and :func:`poultry.consumers.count_tokens`.
+:class:`HyperLogLog` estimates the number of distinct items.
+
+"""
+import hashlib
+import heapq
+import math
+import struct
+
+from array import array
+from collections import Counter
+from operator import itemgetter
+
+from poultry.dedup import _mix64
+
+
+def hash64(value):
+    """A 64 bit hash of an integer or a string.
+
+    Unlike :func:`hash`, the hash is the same in all processes, so that
+    sketches built from different files can be merged.
+
+    >>> hash64(u'pinkpop') == hash64(b'pinkpop')
+    True
+
+    """
+    if isinstance(value, int):
+        return _mix64(value & 0xFFFFFFFFFFFFFFFF)
+
+    if not isinstance(value, bytes):
+        value = value.encode('utf-8')
+
+    return int.from_bytes(hashlib.blake2b(value, digest_size=8).digest(), 'little')
+
+
+def _counted(items):
+    """Items with their counts, the way :meth:`collections.Counter.update` takes them."""
+    if hasattr(items, 'items'):
+        return items
+
+    return Counter(items)
+
+
+class SpaceSaving(object):
+    """Counts of the most frequent items, the Space-Saving algorithm.
+
+    At most `capacity` items are counted. When a new item comes and all the
+    slots are taken, the item with the smallest count is replaced and the
+    new item inherits its count, which is remembered as the error of the
+    count. A count is never underestimated and is overestimated by at most
+    the total count divided by the capacity, so an item that is more
+    frequent than that is always counted.
+
+    :param capacity: the maximal number of counted items.
+
+    >>> counter = SpaceSaving(3)
+    >>> counter.update('abracadabra')
+    >>> counter.most_common(2)
+    [('a', 5), ('c', 3)]
+    >>> counter['c'], counter.error('c')
+    (3, 2)
+
+    """
+
+    #: The approximate memory used per counted item in bytes, including a
+    #: short string item.
+    ITEM_SIZE = 200
+
+    def __init__(self, capacity):
+        if capacity < 1:
+            raise ValueError('At least one item has to be counted, got {}.'.format(capacity))
+
+        self.capacity = capacity
+        self.total = 0
+
+        self._counts = {}
+        self._errors = {}
+        # A (count, item) pair per counted item, the counts are updated
+        # lazily, so they may be lower than the actual ones.
+        self._heap = []
+
+    @classmethod
+    def for_memory(cls, size):
+        """A counter that uses about `size` bytes."""
+        return cls(max(1, size // cls.ITEM_SIZE))
+
+    def __getitem__(self, item):
+        return self._counts.get(item, 0)
+
+    def __contains__(self, item):
+        return item in self._counts
+
+    def __len__(self):
+        return len(self._counts)
+
+    def error(self, item):
+        """The maximal overestimation of the count of an item."""
+        return self._errors.get(item, 0)
+
+    def items(self):
+        return self._counts.items()
+
+    def most_common(self, n=None):
+        """The `n` most frequent items and their counts, see :meth:`collections.Counter.most_common`."""
+        if n is None:
+            return sorted(self._counts.items(), key=itemgetter(1), reverse=True)
+
+        return heapq.nlargest(n, self._counts.items(), key=itemgetter(1))
+
+    def update(self, items):
+        """Count items, `items` is an iterable or a mapping from items to counts."""
+        items = _counted(items)
+        errors = items._errors if isinstance(items, SpaceSaving) else {}
+
+        counts = self._counts
+        new = []
+        for item, count in items.items():
+            self.total += count
+
+            if item in counts:
+                counts[item] += count
+            else:
+                new.append((item, count))
+
+        # The most frequent new items go first, so that the rare ones
+        # replace each other.
+        new.sort(key=itemgetter(1), reverse=True)
+
+        for item, count in new:
+            if len(counts) < self.capacity:
+                counts[item] = count
+                heapq.heappush(self._heap, (count, item))
+                error = 0
+            else:
+                error = self._replace(item, count)
+
+            error += errors.get(item, 0)
+            if error:
+                self._errors[item] = error
+
+    def _replace(self, item, count):
+        """Replace the least frequent item, return its count."""
+        counts = self._counts
+        heap = self._heap
+
+        while True:
+            min_count, min_item = heap[0]
+            current = counts[min_item]
+            if current == min_count:
+                break
+            heapq.heapreplace(heap, (current, min_item))
+
+        del counts[min_item]
+        self._errors.pop(min_item, None)
+
+        counts[item] = min_count + count
+        heapq.heapreplace(heap, (min_count + count, item))
+
+        return min_count
+
+
+class CountMinSketch(object):
+    """Estimated counts of all the items, the Count-Min sketch.
+
+    Each of the `depth` rows of `width` counters is indexed by a different
+    hash of an item, the estimate of a count is the smallest of its
+    counters. A count is never underestimated, the overestimation is at
+    most ``e / width`` of the total count with the probability of
+    ``1 - exp(-depth)``.
+
+    The `k` items with the highest estimates are remembered and are
+    returned by :meth:`most_common`.
+
+    :param width: the number of counters in a row.
+    :param depth: the number of rows.
+    :param k: the number of the most frequent items to remember.
+
+    >>> sketch = CountMinSketch(1024, k=2)
+    >>> sketch.update('abracadabra')
+    >>> sketch['a'], sketch['z']
+    (5, 0)
+    >>> sketch.most_common()
+    [('a', 5), ('b', 2)]
+
+    """
+
+    def __init__(self, width, depth=4, k=100):
+        self.width = width
+        self.depth = depth
+        self.k = k
+        self.total = 0
+
+        self._rows = [array('q', [0]) * width for _ in range(depth)]
+        self._top = {}
+        # No more than the smallest estimate of the remembered items.
+        self._floor = 0
+
+    @classmethod
+    def for_memory(cls, size, depth=4, k=100):
+        """A sketch of about `size` bytes."""
+        return cls(max(1, size // (8 * depth)), depth=depth, k=k)
+
+    def _positions(self, item):
+        # Double hashing with two halves of a 64 bit hash, as in a Bloom filter.
+        h = hash64(item)
+        h1, h2 = h & 0xFFFFFFFF, (h >> 32) | 1
+
+        width = self.width
+        return [(h1 + i * h2) % width for i in range(self.depth)]
+
+    def __getitem__(self, item):
+        return min(row[p] for row, p in zip(self._rows, self._positions(item)))
+
+    def items(self):
+        """The remembered items and their current estimates."""
+        return [(item, self[item]) for item in self._top]
+
+    def most_common(self, n=None):
+        """The `n` most frequent remembered items and their estimated counts."""
+        return heapq.nlargest(self.k if n is None else n, self.items(), key=itemgetter(1))
+
+    def update(self, items):
+        """Count items, `items` is an iterable, a mapping from items to counts or a sketch."""
+        if isinstance(items, CountMinSketch):
+            self._merge(items)
+            return
+
+        rows = self._rows
+        for item, count in _counted(items).items():
+            self.total += count
+
+            estimate = None
+            for row, p in zip(rows, self._positions(item)):
+                row[p] += count
+                if estimate is None or row[p] < estimate:
+                    estimate = row[p]
+
+            self._remember(item, estimate)
+
+    def _merge(self, other):
+        if (other.width, other.depth) != (self.width, self.depth):
+            raise ValueError(
+                "Can't merge a {}x{} sketch to a {}x{} one.".format(
+                    other.depth, other.width, self.depth, self.width,
+                )
+            )
+
+        for row, other_row in zip(self._rows, other._rows):
+            for i, count in enumerate(other_row):
+                if count:
+                    row[i] += count
+        self.total += other.total
+
+        candidates = set(self._top).union(other._top)
+        self._top = {}
+        self._floor = 0
+        for item in candidates:
+            self._remember(item, self[item])
+
+    def _remember(self, item, estimate):
+        top = self._top
+        if item in top or len(top) < self.k:
+            top[item] = estimate
+            return
+
+        if estimate <= self._floor:
+            return
+
+        min_item = min(top, key=top.get)
+        if top[min_item] < estimate:
+            del top[min_item]
+            top[item] = estimate
+
+        self._floor = min(top.values())
+
+
+class HyperLogLog(object):
+    """An estimate of the number of distinct items, the HyperLogLog algorithm.
+
+    An item is hashed by :func:`hash64`, the first `precision` bits of the
+    hash choose one of ``2 ** precision`` registers, which keeps the
+    maximal position of the first set bit in the rest of the hash. The
+    registers take a byte each, the standard error of the estimate is
+    ``1.04 / sqrt(2 ** precision)``, 1.6% for the default precision.
+
+    Sketches of the same precision are merged by :meth:`update`, the result
+    is the same as if all the items were added to one sketch.
+
+    :param precision: the number of bits that choose a register, from 4 to
+                      16.
+
+    >>> users = HyperLogLog()
+    >>> for user_id in range(1000):
+    ...     users.add(user_id % 100)
+    >>> abs(len(users) - 100) <= 2
+    True
+
+    """
+
+    def __init__(self, precision=12):
+        if not 4 <= precision <= 16:
+            raise ValueError('The precision must be from 4 to 16, got {}.'.format(precision))
+
+        self.precision = precision
+        self.registers = bytearray(1 << precision)
+
+    def add(self, item):
+        """Add an item, an integer or a string."""
+        h = hash64(item)
+        rest_bits = 64 - self.precision
+        rest = h & ((1 << rest_bits) - 1)
+
+        rank = rest_bits - rest.bit_length() + 1
+        register = h >> rest_bits
+        if self.registers[register] < rank:
+            self.registers[register] = rank
+
+    def update(self, items):
+        """Add items or merge another sketch."""
+        if not isinstance(items, HyperLogLog):
+            for item in items:
+                self.add(item)
+            return
+
+        if items.precision != self.precision:
+            raise ValueError(
+                "Can't merge a sketch of precision {} to one of {}.".format(items.precision, self.precision)
+            )
+        self.registers = bytearray(map(max, self.registers, items.registers))
+
+    def count(self):
+        """The estimated number of distinct items."""
+        m = len(self.registers)
+        estimate = _hll_alpha(m) * m * m / math.fsum(2.0 ** -r for r in self.registers)
+
+        # Linear counting is more precise for small numbers.
+        zeros = self.registers.count(0)
+        if zeros and estimate <= 2.5 * m:
+            estimate = m * math.log(m / zeros)
+
+        return int(round(estimate))
+
+    __len__ = count
+
+    def to_bytes(self):
+        """The sketch as bytes, see :meth:`from_bytes`."""
+        return struct.pack('<B', self.precision) + bytes(self.registers)
+
+    @classmethod
+    def from_bytes(cls, data):
+        """A sketch from the bytes given by :meth:`to_bytes`."""
+        sketch = cls(data[0])
+        if len(data) != 1 + len(sketch.registers):
+            raise ValueError('Expected {} bytes, got {}.'.format(1 + len(sketch.registers), len(data)))
+
+        sketch.registers = bytearray(data[1:])
+        return sketch
+
+
+def _hll_alpha(m):
+    """The bias correction constant of HyperLogLog."""
+    return {16: 0.673, 32: 0.697, 64: 0.709}.get(m, 0.7213 / (1 + 1.079 / m))
+
+
+def save_sketches(sketches, f):
+    """Write a dictionary from names to :class:`HyperLogLog` sketches to a binary file."""
+    for name, sketch in sorted(sketches.items()):
+        name = name.encode('utf-8')
+        data = sketch.to_bytes()
+        f.write(_RECORD.pack(len(name), len(data)) + name + data)
+
+
+def load_sketches(f):
+    """Read the sketches written by :func:`save_sketches`."""
+    sketches = {}
+    while True:
+        header = f.read(_RECORD.size)
+        if not header:
+            return sketches
+
+        name_size, data_size = _RECORD.unpack(header)
+        name = f.read(name_size).decode('utf-8')
+        sketches[name] = HyperLogLog.from_bytes(f.read(data_size))
+
+
+_RECORD = struct.Struct('<II')
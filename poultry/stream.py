@@ -43,6 +43,7 @@ class StreamProducer(Thread):
     :param follow: A list of user ids to follow.
     :param track: A list of phrases to track.
     :param locations: A list of coordinates to get.
+    :param binary: Send the received lines as bytes, without decoding them.
 
     ..todo:: Parameter description!
 
@@ -55,6 +56,7 @@ class StreamProducer(Thread):
     def __init__(self, target, twitter_credentials,
                  follow=None, track=None, locations=None, language=None,
                  url='https://stream.twitter.com/1.1/statuses/filter.json',
+                 binary=False,
                  *args, **kwargs):
         super(StreamProducer, self).__init__(*args, **kwargs)
 
@@ -66,6 +68,7 @@ class StreamProducer(Thread):
         self.language = language if language is not None else []
 
         self.url = url
+        self.binary = binary
         self.client = create_client(twitter_credentials)
 
     def _run(self):
@@ -98,7 +101,7 @@ class StreamProducer(Thread):
 
         line = None
         for line in response.iter_lines():
-            target.send(line.decode('utf-8'))
+            target.send(line if self.binary else line.decode('utf-8'))
         else:
             # XXX Should be changed to something meaningful
             raise EndOfStreamError(line)
@@ -149,7 +152,7 @@ def from_simple_queue(target, queue):
             target.send(item)
 
 
-def from_twitter_api(target, endpoint, config):
+def from_twitter_api(target, endpoint, config, binary=False):
     """Consume tweets from a Streaming API endpoint."""
     endpoint_to_url = {
         'twitter://sample': 'https://stream.twitter.com/1.1/statuses/sample.json',
@@ -177,6 +180,7 @@ def from_twitter_api(target, endpoint, config):
         twitter_credentials=dict(config.items('twitter')),
         target=consumers.to_simple_queue(queue),
         url=endpoint_to_url[endpoint],
+        binary=binary,
         **kwargs
     )
 
@@ -0,0 +1,241 @@
+"""Tweet timestamp parsing.
+
+Twitter represents tweet creation time as a string of a fixed layout, for
+example ``Fri Apr 13 13:55:02 +0000 2012``. Tweet IDs generated by
+Snowflake also encode the creation time in milliseconds.
+
+Tweets are grouped to files and counted by time windows named by
+:meth:`datetime.datetime.strftime` templates, :class:`Bucketer` formats a
+name once per window. Times are counted per window in batches by
+:meth:`Bucketer.counts`, which uses NumPy if it is installed.
+
+"""
+import functools
+import re
+
+from collections import Counter
+from datetime import datetime, timedelta
+from email.utils import parsedate_tz
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+#: The Snowflake epoch in milliseconds.
+SNOWFLAKE_EPOCH = 1288834974657
+
+#: The last tweet id that was not generated by Snowflake.
+SNOWFLAKE_MIN_ID = 29700859247
+
+_MONTHS = {
+    m: i for i, m in enumerate('Jan Feb Mar Apr May Jun Jul Aug Sep Oct Nov Dec'.split(), 1)
+}
+_UNIX_EPOCH = datetime(1970, 1, 1)
+_TWITTER_LAYOUT = re.compile(
+    r'[A-Za-z]{3} ([A-Za-z]{3}) (\d\d) (\d\d):(\d\d):(\d\d) [+-]\d{4} (\d{4})',
+    re.ASCII,
+)
+
+
+@functools.lru_cache(maxsize=2 ** 16)
+def parse_created_at(created_at):
+    """Convert a date represented in the Twitter format to a datetime object.
+
+    The time zone offset is ignored, as it is always ``+0000`` for tweets.
+
+    >>> parse_created_at('Fri Apr 13 13:55:02 +0000 2012')
+    datetime.datetime(2012, 4, 13, 13, 55, 2)
+
+    Dates in other formats are parsed by :func:`email.utils.parsedate_tz`.
+
+    >>> parse_created_at('13 Apr 2012 13:55:02 +0000')
+    datetime.datetime(2012, 4, 13, 13, 55, 2)
+
+    """
+    try:
+        return _parse_twitter_layout(created_at)
+    except (ValueError, KeyError):
+        pass
+
+    time_tuple = parsedate_tz(created_at)
+    return datetime(*time_tuple[:6])
+
+
+def _parse_twitter_layout(created_at):
+    """Parse the ``%a %b %d %H:%M:%S %z %Y`` layout."""
+    m = _TWITTER_LAYOUT.fullmatch(created_at)
+    if m is None:
+        raise ValueError('{!r} does not follow the Twitter layout.'.format(created_at))
+
+    month, day, hour, minute, second, year = m.groups()
+    return datetime(int(year), _MONTHS[month], int(day), int(hour), int(minute), int(second))
+
+
+def snowflake_to_timestamp(id_):
+    """The creation time of a Snowflake tweet id in milliseconds since the Unix epoch.
+
+    `None` is returned for ids that were not generated by Snowflake.
+
+    >>> snowflake_to_timestamp(190800262909276162)
+    1334325302232
+
+    """
+    if id_ <= SNOWFLAKE_MIN_ID:
+        return None
+
+    return (id_ >> 22) + SNOWFLAKE_EPOCH
+
+
+def snowflake_to_datetime(id_):
+    """The creation time of a Snowflake tweet id truncated to seconds.
+
+    The result is the same as if the ``created_at`` field was parsed.
+
+    >>> snowflake_to_datetime(190800262909276162)
+    datetime.datetime(2012, 4, 13, 13, 55, 2)
+    >>> snowflake_to_datetime(1000) is None
+    True
+
+    """
+    timestamp = snowflake_to_timestamp(id_)
+    if timestamp is None:
+        return None
+
+    return _UNIX_EPOCH + timedelta(seconds=timestamp // 1000)
+
+
+#: The length in seconds of the period during which the directives don't
+#: change. Directives that aren't listed change every second.
+_DIRECTIVE_GRANULARITY = dict(
+    [(d, 86400) for d in 'aAwdbBhmyYjUWGgVuCeDFxzZnt%'] +
+    [(d, 3600) for d in 'HIpkl'] +
+    [(d, 60) for d in 'MR']
+)
+_DIRECTIVE = re.compile('%[-_0^#]?(.)', re.DOTALL)
+
+
+def template_granularity(template):
+    """The length in seconds of the periods a strftime template names.
+
+    >>> template_granularity('%Y-%m-%d-%H.gz')
+    3600
+    >>> template_granularity('%Y/%m/%d.gz')
+    86400
+    >>> template_granularity('%H:%M:%S')
+    1
+
+    """
+    return min(
+        [_DIRECTIVE_GRANULARITY.get(d, 1) for d in _DIRECTIVE.findall(template)] + [86400]
+    )
+
+
+def datetime_to_seconds(dt):
+    """Seconds since the Unix epoch of a naive UTC datetime.
+
+    >>> datetime_to_seconds(datetime(2012, 4, 13, 13, 55, 2))
+    1334325302
+
+    """
+    return (dt.toordinal() - _UNIX_EPOCH_ORDINAL) * 86400 + dt.hour * 3600 + dt.minute * 60 + dt.second
+
+
+_UNIX_EPOCH_ORDINAL = _UNIX_EPOCH.toordinal()
+
+
+class Bucketer(object):
+    """Name times by a strftime template, formatting once per time bucket.
+
+    The time line is split to buckets of the :func:`template_granularity`
+    of the template, for example an hour for ``%Y-%m-%d-%H``. A bucket is
+    found by integer division of epoch seconds, its name is formatted once
+    and is cached. The names are the same as the ones given by
+    :meth:`datetime.datetime.strftime`.
+
+    :param template: a strftime template.
+    :param max_cache_size: the number of names to keep, the cache is cleared
+                           when it is full.
+
+    >>> bucketer = Bucketer('%Y-%m-%d-%H.gz')
+    >>> bucketer(datetime(2012, 4, 13, 13, 55, 2))
+    '2012-04-13-13.gz'
+    >>> bucketer.name(1334325302)
+    '2012-04-13-13.gz'
+
+    """
+
+    def __init__(self, template, max_cache_size=2 ** 16):
+        self.template = template
+        self.granularity = template_granularity(template)
+        self.max_cache_size = max_cache_size
+
+        self._names = {}
+
+    def __call__(self, dt):
+        """The name of a naive UTC datetime."""
+        if self.granularity == 1:
+            return dt.strftime(self.template)
+
+        return self.name(datetime_to_seconds(dt))
+
+    def name(self, seconds):
+        """The name of a time in seconds since the Unix epoch."""
+        bucket = seconds // self.granularity
+
+        try:
+            return self._names[bucket]
+        except KeyError:
+            pass
+
+        if len(self._names) >= self.max_cache_size:
+            self._names.clear()
+
+        start = _UNIX_EPOCH + timedelta(seconds=bucket * self.granularity)
+        name = self._names[bucket] = start.strftime(self.template)
+
+        return name
+
+    def counts(self, seconds):
+        """Count times in seconds since the Unix epoch by their names.
+
+        The times are divided to buckets at once and each bucket is named
+        once, with NumPy if it is installed.
+
+        >>> Bucketer('%Y-%m-%d').counts([1334325302, 1335425739, 1334275200])
+        {'2012-04-13': 2, '2012-04-26': 1}
+
+        """
+        if not seconds:
+            return {}
+
+        if numpy is not None:
+            buckets = _numpy_bucket_counts(seconds, self.granularity)
+        else:
+            granularity = self.granularity
+            buckets = Counter(s // granularity for s in seconds).items()
+
+        result = {}
+        for bucket, count in sorted(buckets):
+            # Different buckets may have the same name, e.g. for ``%H``.
+            name = self.name(bucket * self.granularity)
+            result[name] = result.get(name, 0) + count
+
+        return result
+
+
+def _numpy_bucket_counts(seconds, granularity):
+    """Pairs of buckets and the number of times in them."""
+    buckets = numpy.floor_divide(numpy.array(seconds, dtype=numpy.int64), granularity)
+
+    low = int(buckets.min())
+    span = int(buckets.max()) - low + 1
+    if span <= 4 * len(buckets):
+        # Tweets usually come in time order, so the buckets are dense.
+        counts = numpy.bincount(buckets - low)
+        (found, ) = counts.nonzero()
+        return zip((found + low).tolist(), counts[found].tolist())
+
+    buckets, counts = numpy.unique(buckets, return_counts=True)
+    return zip(buckets.tolist(), counts.tolist())
@@ -1,63 +1,166 @@
-import json
+import functools
 import logging
+import re
 import unicodedata
 import sys
 
 from collections import namedtuple
-from datetime import datetime
-from email.utils import parsedate_tz
 from itertools import chain
 
+from poultry import jsonlib
+from poultry.matchers import Matcher
+from poultry.timestamps import SNOWFLAKE_MIN_ID, parse_created_at, snowflake_to_datetime
+
 
 logger = logging.getLogger(__name__)
 TWEET_CREATED_AT_CHANGE_WARNING = False
 
 
+def _memoized(func):
+    """A read only property that is computed at most once.
+
+    The value is stored in the `_<name>` slot of the instance.
+
+    """
+    slot = '_{}'.format(func.__name__)
+
+    @functools.wraps(func)
+    def getter(self):
+        try:
+            return getattr(self, slot)
+        except AttributeError:
+            pass
+
+        value = func(self)
+        setattr(self, slot, value)
+        return value
+
+    return property(getter)
+
+
 class Tweet(object):
-    def __init__(self, raw_json):
+    """A tweet.
+
+    :param raw_json: the json representation of a tweet (either text or
+                     UTF-8 encoded bytes), or an already parsed tweet
+                     dictionary.
+
+    :param fields: an optional collection of field names the caller is
+                   interested in. If it is given, the tweet is lazy: the
+                   fields are pulled from the raw line on first access and
+                   the full json decoding happens only when `parsed` is
+                   touched. Only the top level `created_at` and `id` fields
+                   can be extracted from a raw line, access to the other
+                   fields falls back to the full decoding.
+
+    A lazy tweet is checked without decoding: the line has to be one
+    object with a top level `text` or `full_text` field, and its brackets,
+    outside of the strings, have to match, so that cut off lines are
+    rejected as they are by the decoder. Lines the check is unsure about
+    are decoded right away.
+
+    The derived properties (`hashtags`, `tokens`, `coordinates`, etc.) are
+    computed once and shared between the calls, they should not be modified.
+
+    """
+    __slots__ = (
+        '_raw', '_parsed', '_fields', '_created_at', '_retweeted_status',
+        '_id', '_orig_created_at', '_hashtags', '_urls', '_user_mentions',
+        '_user_mention_ids', '_bounding_box', '_coordinates',
+        '_text_without_entities', '_tokens',
+    )
+
+    def __init__(self, raw_json, fields=None):
+        self._fields = frozenset()
 
         if isinstance(raw_json, dict):
-            self.parsed = raw_json
-            self.raw = None
+            self._parsed = raw_json
+            self._raw = None
+        elif fields is not None:
+            looks_like_tweet = _looks_like_tweet(raw_json)
+            if looks_like_tweet is False:
+                raise TweetValueError("There is no 'text' field in the passed json.")
+
+            self._raw = raw_json
+            self._parsed = None
+            self._fields = frozenset(fields).intersection(_RAW_FIELDS)
+
+            if looks_like_tweet is None or not _looks_complete(raw_json):
+                # The line is cut off or the check is unsure, the decoder decides.
+                self._parsed = self._parse(raw_json)
         else:
-            try:
-                tweet = json.loads(raw_json)
-            except ValueError:
-                raise TweetValueError("The passed json can't be parsed.")
+            self._raw = raw_json
+            self._parsed = self._parse(raw_json)
+
+    @staticmethod
+    def _parse(raw_json):
+        try:
+            tweet = jsonlib.loads(raw_json)
+        except ValueError:
+            raise TweetValueError("The passed json can't be parsed.")
+        else:
+            if isinstance(tweet, dict) and ('text' in tweet or 'full_text' in tweet):
+                return tweet
             else:
-                if isinstance(tweet, dict) and ('text' in tweet or 'full_text' in tweet):
-                    self.raw = raw_json
-                    self.parsed = tweet
-                else:
-                    raise TweetValueError("There is no 'text' field in the passed json.")
+                raise TweetValueError("There is no 'text' field in the passed json.")
+
+    @property
+    def parsed(self):
+        """The decoded json object of the tweet."""
+        if self._parsed is None:
+            self._parsed = self._parse(self._raw)
+
+        return self._parsed
+
+    @property
+    def raw(self):
+        """The json representation of the tweet.
+
+        If the tweet was built from a dictionary, it is serialized on the
+        first access.
+
+        """
+        if self._raw is None:
+            self._raw = jsonlib.dumps(self._parsed)
+
+        return self._raw
+
+    def _field(self, name):
+        """Get a top level field, avoiding the full decoding if possible."""
+        if self._parsed is None and name in self._fields:
+            value = _raw_field(self._raw, name)
+            if value is not None:
+                return value
+
+        return self.parsed[name]
 
     @property
     def text(self):
         """The unprocessed text of the tweet."""
         return self.parsed['full_text'] if 'full_text' in self.parsed else self.parsed['text']
 
-    @property
+    @_memoized
     def hashtags(self):
         '''
         The lowercased hashtags that are in the tweet.
         '''
         return set(h['text'].lower() for h in self.parsed['entities']['hashtags'])
 
-    @property
+    @_memoized
     def urls(self):
         '''
         The urls that are in the tweet.
         '''
         return set(u['url'] for u in self.parsed['entities']['urls'])
 
-    @property
+    @_memoized
     def user_mentions(self):
         '''
         The mentioned users in the tweet.
         '''
         return set(m['screen_name'] for m in self.parsed['entities']['user_mentions'])
 
-    @property
+    @_memoized
     def user_mention_ids(self):
         '''
         The IDs of the mentioned users in the tweet.
@@ -101,10 +204,22 @@ class Tweet(object):
 
         self._created_at = value
 
-    @property
+    @_memoized
     def orig_created_at(self):
+        # Snowflake ids encode the creation time, decoding it is cheaper than
+        # parsing created_at. The id is used if it's known without decoding
+        # the whole tweet.
+        if self._parsed is not None or 'id' in self._fields:
+            try:
+                id_ = self._field('id')
+            except KeyError:
+                pass
+            else:
+                if isinstance(id_, int) and id_ > SNOWFLAKE_MIN_ID:
+                    return snowflake_to_datetime(id_)
+
         try:
-            created_at = self.parsed['created_at']
+            created_at = self._field('created_at')
         except KeyError:
             logger.warning("An error accessing ['created_at']")
         else:
@@ -116,27 +231,27 @@ class Tweet(object):
         Convert a date represented in the Twitter format to a datetime
         object.
         '''
-        time_tuple = parsedate_tz(created_at)
-        return datetime(*time_tuple[:6])
+        return parse_created_at(created_at)
 
-    @property
+    @_memoized
     def retweeted_status(self):
-        try:
-            return Tweet(json.dumps(self.parsed['retweeted_status']))
-        except ValueError:
-            pass
-        except KeyError:
-            pass
+        """The retweeted tweet, `None` if the tweet is not a retweet."""
+        retweeted_status = self.parsed.get('retweeted_status')
 
-    @property
+        if isinstance(retweeted_status, dict) and (
+            'text' in retweeted_status or 'full_text' in retweeted_status
+        ):
+            return Tweet(retweeted_status)
+
+    @_memoized
     def id(self):
-        return self.parsed['id']
+        return self._field('id')
 
     @property
     def lang(self):
         return self.parsed['lang']
 
-    @property
+    @_memoized
     def bounding_box(self):
         """The bounding box of the tweet.
 
@@ -165,7 +280,7 @@ class Tweet(object):
                 ]
                 return result
 
-    @property
+    @_memoized
     def coordinates(self):
         """The coordinates of the tweet."""
         return (self.bounding_box or [[None]])[0][0]
@@ -177,7 +292,7 @@ class Tweet(object):
         '''
         return 'https://twitter.com/#!/{t.screen_name}/status/{t.id}'.format(t=self)
 
-    @property
+    @_memoized
     def text_without_entities(self):
         '''
         The text of the tweet without entities (hashtags, ursl and
@@ -193,7 +308,7 @@ class Tweet(object):
 
         return u''.join(filter(None, text))
 
-    @property
+    @_memoized
     def tokens(self):
         '''
         Tokenized text of the tweet.
@@ -260,70 +375,19 @@ class Tweet(object):
 
         :return: `True` if there is a match, `False` otherwise.
 
-        Mimics Twitter `statuses/filter`_ method of the Streaming API.
-
-        .. _statuses/filter: https://dev.twitter.com/docs/streaming-api/methods#statuses-filter
+        The predicates are compiled for every call, use
+        :class:`poultry.matchers.Matcher` to match many tweets.
         '''
-
-        if start_date is not None and self.created_at < start_date:
-            return False
-
-        if end_date is not None and end_date < self.created_at:
-            return False
-
-        follow = set(int(f) for f in follow) if follow is not None else set()
-
-        try:
-            unicode
-        except NameError:
-            unicode = str
-
-        track = set(unicode(t.lower()) for t in track) if track is not None else set()
-        locations = set(locations) if locations is not None else set()
-        language = set(language) if language is not None else set()
-
-        common_follow = follow.intersection(self.user_mentions) or self.user_id in follow
-        common_track = (t.lower() in self.text.lower() for t in track)
-        common_language = self.lang in language if language else True
-
-        coor = self.coordinates
-        place = self.parsed['place']
-        if coor:
-            common_location = (
-                sw[0] <= coor.lon <= ne[0] and
-                sw[1] <= coor.lat <= ne[1]
-                for sw, ne in locations
-            )
-        elif place and place['bounding_box']:
-            # XXX Is it always a rectangle?
-            bounding_box = place['bounding_box']['coordinates'][0]
-
-            # XXX not the best way to intersect the given location and
-            # the tweet's place polygon.
-            sw_lon = min(lon for lon, lat in bounding_box)
-            sw_lat = min(lat for lon, lat in bounding_box)
-            ne_lon = max(lon for lon, lat in bounding_box)
-            ne_lat = max(lat for lon, lat in bounding_box)
-
-            common_location = (not (sw[0] > ne_lon or
-                                    ne[0] < sw_lon or
-                                    ne[1] > sw_lat or
-                                    sw[1] < ne_lat)
-                               for sw, ne in locations)
-
-        else:
-            common_location = []
-
-        search_terms = ([follow, track, locations])
-        common = any(
-            [
-                common_follow,
-                any(common_track),
-                any(common_location),
-            ]
+        matcher = Matcher(
+            follow=follow,
+            track=track,
+            locations=locations,
+            language=language,
+            start_date=start_date,
+            end_date=end_date,
         )
 
-        return bool(not any(search_terms) or common) and common_language
+        return matcher.match(self)
 
     def __unicode__(self):
         return (
@@ -351,6 +415,123 @@ class Tweet(object):
             return self.__unicode__().encode('utf8')
 
 
+def _compile(pattern, flags=0):
+    """Compile a regular expression for both text and binary lines."""
+    return {
+        str: re.compile(pattern, flags),
+        bytes: re.compile(pattern.encode('ascii'), flags),
+    }
+
+
+def _match_type(raw_json):
+    return bytes if isinstance(raw_json, (bytes, bytearray)) else str
+
+
+def _to_str(value):
+    return value.decode('ascii') if isinstance(value, bytes) else value
+
+
+_RAW_FIELDS = {
+    'created_at': (_compile(r'"created_at"\s*:\s*"([^"\\]*)"'), _to_str),
+    'id': (_compile(r'"id"\s*:\s*(\d+)[\s,}]'), int),
+}
+_TWEET_START = _compile(r'\s*\{')
+_TEXT_KEY = _compile(r'"(?:full_)?text"\s*:')
+# Anything but brackets, the strings are skipped as a whole.
+_JSON_SKIP = r'[^"{}\[\]]*(?:"[^"\\]*(?:\\.[^"\\]*)*"[^"{}\[\]]*)*'
+_JSON_TOKEN = _compile(_JSON_SKIP + r'(?:(?P<open>[{\[])|(?P<close>[}\]]))', re.DOTALL)
+_JSON_TAIL = _compile(_JSON_SKIP + r'\Z', re.DOTALL)
+_CLOSING = {str: {'{': '}', '[': ']'}}
+_CLOSING[bytes] = {k.encode('ascii'): v.encode('ascii') for k, v in _CLOSING[str].items()}
+
+
+def _looks_like_tweet(raw_json):
+    """Check whether a raw line is an object with a top level text field.
+
+    `None` is returned if the check is unsure.
+
+    """
+    type_ = _match_type(raw_json)
+    if _TWEET_START[type_].match(raw_json) is None:
+        return False
+
+    for m in _TEXT_KEY[type_].finditer(raw_json):
+        depth = _depth(raw_json, m.start())
+        if depth is None:
+            return None
+        if depth == 1:
+            return True
+
+    return False
+
+
+def _looks_complete(raw_json):
+    """Check whether a raw line is one whole json object.
+
+    The line is walked from bracket to bracket, skipping the strings. The
+    brackets have to match and the outermost object has to be closed at
+    the end of the line. Lines that are cut off, including in the middle of
+    a string, are rejected.
+
+    """
+    type_ = _match_type(raw_json)
+    token, closing = _JSON_TOKEN[type_], _CLOSING[type_]
+
+    raw_json = raw_json.rstrip()
+    end = len(raw_json)
+
+    expected = []
+    pos = 0
+    while pos < end:
+        m = token.match(raw_json, pos)
+        if m is None:
+            return False
+
+        if m.lastgroup == 'open':
+            expected.append(closing[m.group('open')])
+        elif not expected or expected.pop() != m.group('close'):
+            return False
+        elif not expected:
+            return m.end() == end
+
+        pos = m.end()
+
+    return False
+
+
+def _depth(raw_json, end):
+    """The nesting depth of a position in a json document.
+
+    `None` is returned if the prefix of the document can't be tokenized.
+
+    """
+    type_ = _match_type(raw_json)
+    token = _JSON_TOKEN[type_]
+
+    depth = 0
+    pos = 0
+    while True:
+        m = token.match(raw_json, pos, end)
+        if m is None:
+            return depth if _JSON_TAIL[type_].match(raw_json, pos, end) else None
+
+        depth += 1 if m.lastgroup == 'open' else -1
+        pos = m.end()
+
+
+def _raw_field(raw_json, name):
+    """Extract a top level scalar field from a raw json line.
+
+    `None` is returned if the field can't be extracted reliably.
+
+    """
+    patterns, type_ = _RAW_FIELDS[name]
+
+    m = patterns[_match_type(raw_json)].search(raw_json)
+    if m is not None and _depth(raw_json, m.start()) == 1:
+        return type_(m.group(1))
+
+
 class TweetValueError(ValueError):
     '''Thrown when a class:`Tweet` can't be built.'''
 
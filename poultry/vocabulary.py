@@ -0,0 +1,198 @@
+"""Compact token counts.
+
+:class:`Vocabulary` maps tokens to dense integer ids and keeps their counts
+in an array. The tokens are stored as UTF-8 in one buffer, so a distinct
+token takes its length and about 40 bytes, instead of a string object and a
+dictionary entry of a :class:`collections.Counter`. Vocabularies are saved
+to files and merged without hashing the tokens again.
+
+"""
+import struct
+import sys
+
+from array import array
+from collections import Counter
+from heapq import nlargest
+
+from poultry.sketches import hash64
+
+
+class Vocabulary(object):
+    """Counts of tokens indexed by dense ids.
+
+    The ids are given in the order the tokens are first seen. A token is
+    found by its :func:`poultry.sketches.hash64` in an open addressing
+    table of ids, the hashes are kept, so the table is grown and
+    vocabularies are merged without hashing the tokens again.
+
+    A vocabulary can be used in place of a :class:`collections.Counter` by
+    :func:`poultry.consumers.count` and
+    :func:`poultry.consumers.count_tokens`.
+
+    >>> vocabulary = Vocabulary()
+    >>> vocabulary.update(u'to be or not to be'.split())
+    >>> vocabulary[u'be'], vocabulary.id(u'be'), vocabulary.token(1)
+    (2, 1, 'be')
+    >>> vocabulary.most_common(2)
+    [('to', 2), ('be', 2)]
+
+    """
+
+    def __init__(self):
+        self.counts = array('q')
+
+        self._data = bytearray()
+        self._offsets = array('q', [0])
+        self._hashes = array('Q')
+        # Ids plus one, zero marks an empty slot.
+        self._table = array('i', [0]) * 8
+
+    def __len__(self):
+        return len(self.counts)
+
+    def __contains__(self, token):
+        return self.id(token) is not None
+
+    def __getitem__(self, token):
+        id_ = self.id(token)
+        return 0 if id_ is None else self.counts[id_]
+
+    def id(self, token):
+        """The id of a token, `None` if it was not seen."""
+        data = _encode(token)
+        return self._find(data, hash64(data))
+
+    def token(self, id_):
+        """The token of an id."""
+        return self._data[self._offsets[id_]:self._offsets[id_ + 1]].decode('utf-8')
+
+    def tokens(self):
+        """The tokens in the order of their ids."""
+        return [self.token(i) for i in range(len(self))]
+
+    def items(self):
+        return zip(self.tokens(), self.counts)
+
+    def most_common(self, n=None):
+        """The `n` most frequent tokens and their counts, see :meth:`collections.Counter.most_common`."""
+        counts = self.counts
+        ids = range(len(counts))
+        if n is None:
+            ids = sorted(ids, key=counts.__getitem__, reverse=True)
+        else:
+            ids = nlargest(n, ids, key=counts.__getitem__)
+
+        return [(self.token(i), counts[i]) for i in ids]
+
+    def update(self, items):
+        """Count tokens, `items` is an iterable, a mapping from tokens to counts or a vocabulary."""
+        if isinstance(items, Vocabulary):
+            self._merge(items)
+            return
+
+        if not hasattr(items, 'items'):
+            items = Counter(items)
+
+        counts = self.counts
+        for token, count in items.items():
+            data = _encode(token)
+            counts[self._add(data, hash64(data))] += count
+
+    def _merge(self, other):
+        counts = self.counts
+        data, offsets, hashes = other._data, other._offsets, other._hashes
+
+        for i, count in enumerate(other.counts):
+            counts[self._add(data[offsets[i]:offsets[i + 1]], hashes[i])] += count
+
+    def _find(self, data, hash_):
+        table, mask = self._table, len(self._table) - 1
+        hashes, offsets = self._hashes, self._offsets
+
+        slot = hash_ & mask
+        while table[slot]:
+            id_ = table[slot] - 1
+            if hashes[id_] == hash_ and self._data[offsets[id_]:offsets[id_ + 1]] == data:
+                return id_
+            slot = (slot + 1) & mask
+
+        return None
+
+    def _add(self, data, hash_):
+        """The id of a token, it is added if it was not seen."""
+        id_ = self._find(data, hash_)
+        if id_ is not None:
+            return id_
+
+        id_ = len(self.counts)
+        self.counts.append(0)
+        self._data += data
+        self._offsets.append(len(self._data))
+        self._hashes.append(hash_)
+
+        # The table is kept at most half full.
+        if 2 * (id_ + 1) > len(self._table):
+            self._rebuild(2 * len(self._table))
+        else:
+            self._insert(id_)
+
+        return id_
+
+    def _insert(self, id_):
+        table, mask = self._table, len(self._table) - 1
+
+        slot = self._hashes[id_] & mask
+        while table[slot]:
+            slot = (slot + 1) & mask
+        table[slot] = id_ + 1
+
+    def _rebuild(self, size):
+        self._table = array('i', [0]) * size
+        for id_ in range(len(self.counts)):
+            self._insert(id_)
+
+    def save(self, f):
+        """Write the vocabulary to a binary file."""
+        f.write(_HEADER.pack(_MAGIC, len(self), len(self._data)))
+        for a in self._offsets, self._hashes, self.counts:
+            f.write(_little_endian(a).tobytes())
+        f.write(self._data)
+
+    @classmethod
+    def load(cls, f):
+        """Read a vocabulary written by :meth:`save`."""
+        magic, size, data_size = _HEADER.unpack(f.read(_HEADER.size))
+        if magic != _MAGIC:
+            raise ValueError('Not a vocabulary file.')
+
+        vocabulary = cls()
+        for name, typecode, length in ('_offsets', 'q', size + 1), ('_hashes', 'Q', size), ('counts', 'q', size):
+            a = array(typecode)
+            a.frombytes(f.read(8 * length))
+            setattr(vocabulary, name, _little_endian(a))
+        vocabulary._data = bytearray(f.read(data_size))
+
+        table_size = 8
+        while table_size < 2 * size:
+            table_size *= 2
+        vocabulary._rebuild(table_size)
+
+        return vocabulary
+
+
+_MAGIC = b'PVOC'
+_HEADER = struct.Struct('<4sQQ')
+
+
+def _encode(token):
+    return token if isinstance(token, bytes) else token.encode('utf-8')
+
+
+def _little_endian(a):
+    """The array in the little endian byte order, or back to the native one."""
+    if sys.byteorder == 'little':
+        return a
+
+    a = array(a.typecode, a)
+    a.byteswap()
+    return a
@@ -0,0 +1,284 @@
+"""Pools of open output files."""
+import gzip
+import logging
+
+from collections import OrderedDict
+from threading import Thread
+
+try:
+    from Queue import Queue
+except ImportError:
+    from queue import Queue
+
+
+logger = logging.getLogger(__name__)
+
+
+class WriterPool(object):
+    """A bounded pool of files open for writing.
+
+    Files are opened on the first write and are kept open until the pool is
+    full, then the least recently written file is closed. Writing to a
+    closed file reopens it in append mode, even if the pool's mode is
+    ``w``, so that the written data is not lost.
+
+    The data is buffered per file and is written in blocks of at least
+    `buffer_size` bytes, when the file is closed or when :meth:`flush` is
+    called.
+
+    :param max_open_files: the maximal number of open files.
+    :param mode: the mode to open files for the first time, ``a`` to append
+                 and ``w`` to rewrite.
+    :param buffer_size: the size of the write buffer of a file in bytes.
+    :param threads: optional :class:`WriterThreads` that open, write
+                    (and therefore compress) and close the files in the
+                    background.
+    :param opener: a function that, given a file name and a binary mode,
+                   opens a file.
+    :param on_open: a function to call with the name of a file when it is
+                    opened or reopened.
+
+    >>> from io import BytesIO
+    >>> def opener(name, mode):
+    ...     return BytesIO()
+    >>> with WriterPool(2, opener=opener, on_open=print) as pool:
+    ...     for name in 'a', 'b', 'a', 'c', 'a', 'b':
+    ...         pool.write(name, name.encode('ascii'))
+    a
+    b
+    c
+    b
+    >>> pool.opens, pool.evictions, pool.reopens
+    (4, 2, 1)
+
+    """
+
+    def __init__(self, max_open_files=32, mode='a', opener=gzip.open, on_open=None,
+                 buffer_size=2 ** 18, threads=None):
+        if max_open_files < 1:
+            raise ValueError('At least one file has to be open, got {}.'.format(max_open_files))
+
+        self.max_open_files = max_open_files
+        self.mode = mode
+        self.opener = opener
+        self.on_open = on_open
+        self.buffer_size = buffer_size
+        self.threads = threads
+
+        self.opens = 0
+        self.evictions = 0
+        self.reopens = 0
+
+        self._files = OrderedDict()
+        self._opened = set()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def write(self, name, data):
+        """Write data to the named file."""
+        try:
+            f = self._files[name]
+        except KeyError:
+            f = self._open(name)
+        else:
+            self._files.move_to_end(name)
+
+        f.write(data)
+
+    def _open(self, name):
+        if len(self._files) >= self.max_open_files:
+            _, lru = self._files.popitem(last=False)
+            lru.close()
+            self.evictions += 1
+
+        if name in self._opened:
+            mode = 'a'
+            self.reopens += 1
+        else:
+            mode = self.mode
+            self._opened.add(name)
+
+        if self.on_open is not None:
+            self.on_open(name)
+
+        mode = '{}b'.format(mode)
+        if self.threads is not None:
+            f = _ThreadedFile(self.threads, self.opener, name, mode)
+        else:
+            f = self.opener(name, mode)
+
+        f = self._files[name] = _BufferedFile(f, self.buffer_size)
+        self.opens += 1
+
+        return f
+
+    def flush(self):
+        """Write the buffered data of all the open files."""
+        for f in self._files.values():
+            f.flush()
+
+    def close(self):
+        """Close all the open files."""
+        while self._files:
+            _, f = self._files.popitem(last=False)
+            f.close()
+
+        logger.debug(
+            'Opened %s files, %s evictions, %s reopens.',
+            self.opens, self.evictions, self.reopens,
+        )
+
+
+class WriterThreads(object):
+    """Threads that write files in the background.
+
+    All the operations on a file are done by the same thread in the order
+    they are submitted, a file is assigned to a thread by its name. Each
+    thread has a bounded queue, submitting to a full queue blocks until a
+    task is done.
+
+    Compression libraries release the GIL, so the files are compressed in
+    parallel.
+
+    If a task fails, the following tasks are skipped and the first error is
+    raised by every following :meth:`submit` and by :meth:`join`.
+
+    :param threads: the number of threads.
+    :param queue_size: the maximal number of pending tasks per thread.
+
+    >>> threads = WriterThreads(2)
+    >>> done = []
+    >>> for i in range(5):
+    ...     threads.submit('a', done.append, i)
+    >>> threads.join()
+    >>> done
+    [0, 1, 2, 3, 4]
+
+    """
+
+    def __init__(self, threads, queue_size=16):
+        self.error = None
+        self._stopped = False
+
+        self._queues = [Queue(maxsize=queue_size) for _ in range(threads)]
+        self._threads = [Thread(target=self._work, args=(q, )) for q in self._queues]
+
+        for thread in self._threads:
+            thread.daemon = True
+            thread.start()
+
+    def submit(self, name, func, *args):
+        """Call the function with the arguments in the thread of the named file."""
+        self._raise()
+        self._queues[hash(name) % len(self._queues)].put((func, args))
+
+    def join(self):
+        """Wait for the submitted tasks to be done and stop the threads."""
+        if not self._stopped:
+            self._stopped = True
+
+            # The threads keep taking tasks after an error, so the queues
+            # are never full for long.
+            for queue in self._queues:
+                queue.put(StopIteration)
+
+            for thread in self._threads:
+                thread.join()
+
+        self._raise()
+
+    def _raise(self):
+        if self.error is not None:
+            raise self.error
+
+    def _work(self, queue):
+        while True:
+            task = queue.get()
+
+            if task is StopIteration:
+                break
+
+            if self.error is not None:
+                continue
+
+            func, args = task
+            try:
+                func(*args)
+            except Exception as e:
+                logger.exception('Failed to write a file.')
+                if self.error is None:
+                    self.error = e
+
+
+class _ThreadedFile(object):
+    """A file that is opened, written and closed by writer threads.
+
+    If the file can't be opened, the error is kept and the following writes
+    are skipped.
+
+    """
+    __slots__ = 'threads', 'name', 'file', 'error'
+
+    def __init__(self, threads, opener, name, mode):
+        self.threads = threads
+        self.name = name
+        self.file = None
+        self.error = None
+
+        threads.submit(name, self._open, opener, mode)
+
+    def _open(self, opener, mode):
+        try:
+            self.file = opener(self.name, mode)
+        except Exception as e:
+            self.error = e
+            raise
+
+    def write(self, data):
+        self.threads.submit(self.name, self._write, data)
+
+    def _write(self, data):
+        if self.error is None:
+            self.file.write(data)
+
+    def close(self):
+        self.threads.submit(self.name, self._close)
+
+    def _close(self):
+        if self.error is None:
+            self.file.close()
+
+
+class _BufferedFile(object):
+    """A file that is written in blocks."""
+    __slots__ = 'file', 'buffer_size', 'chunks', 'size'
+
+    def __init__(self, file_, buffer_size):
+        self.file = file_
+        self.buffer_size = buffer_size
+
+        self.chunks = []
+        self.size = 0
+
+    def write(self, data):
+        self.chunks.append(data)
+        self.size += len(data)
+
+        if self.size >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        if self.chunks:
+            self.file.write(b''.join(self.chunks))
+            self.chunks = []
+            self.size = 0
+
+    def close(self):
+        try:
+            self.flush()
+        finally:
+            self.file.close()
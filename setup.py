@@ -43,6 +43,12 @@ setup(
         'requests',
         'requests-oauthlib',
     ],
+    extras_require={
+        'gzip': ['isal'],
+        'zstd': ['zstandard'],
+        'lz4': ['lz4'],
+        'numpy': ['numpy'],
+    },
     entry_points={
         'console_scripts': [
             'poultry = poultry.main:dispatch',
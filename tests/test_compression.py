@@ -0,0 +1,93 @@
+import fileinput
+
+from poultry import compression
+
+import pytest
+
+
+@pytest.mark.parametrize(
+    ('extension', 'module'),
+    (
+        ('.gz', None),
+        ('.bz2', None),
+        ('.zst', 'zstandard'),
+        ('.lz4', 'lz4'),
+        ('.json', None),
+    ),
+)
+def test_open_file(tmpdir, extension, module):
+    if module is not None:
+        pytest.importorskip(module)
+
+    file_name = str(tmpdir.join('tweets' + extension))
+
+    with compression.open_file(file_name, 'wb', level=1) as f:
+        f.write(b'one\ntwo\n')
+    # Appending adds another stream.
+    with compression.open_file(file_name, 'ab') as f:
+        f.write(b'three\n')
+
+    with open(file_name, 'rb') as f:
+        assert (f.read() == b'one\ntwo\nthree\n') == (extension == '.json')
+
+    with compression.open_file(file_name) as f:
+        assert f.read() == b'one\ntwo\nthree\n'
+
+    with fileinput.FileInput([file_name], mode='rb', openhook=compression.openhook) as lines:
+        assert list(lines) == [b'one\n', b'two\n', b'three\n']
+
+
+@pytest.mark.parametrize('level', range(10))
+def test_gzip_levels(tmpdir, level):
+    file_name = str(tmpdir.join('tweets.gz'))
+
+    with compression.open_file(file_name, 'wb', level=level) as f:
+        f.write(b'one\n' * 100)
+
+    with compression.open_file(file_name) as f:
+        assert f.read() == b'one\n' * 100
+
+    assert 0 <= compression._isal_level(level) <= 3
+
+
+def test_open_file_default(tmpdir):
+    file_name = str(tmpdir.join('tweets'))
+
+    with compression.open_file(file_name, 'wb', default='.gz') as f:
+        f.write(b'one\n')
+
+    with compression.open_file(file_name, default='.gz') as f:
+        assert f.read() == b'one\n'
+
+
+def test_dictionary(tmpdir, tweets):
+    pytest.importorskip('zstandard')
+
+    lines = [
+        t.replace('190800262909276162', str(190800262909276162 + i)).encode('utf-8') + b'\n'
+        for i, t in enumerate(tweets * 100)
+    ]
+    dictionary = compression.train_dictionary(lines, size=2 ** 12)
+    file_name = str(tmpdir.join('tweets.zst'))
+
+    with compression.open_file(file_name, 'wb', dictionary=dictionary) as f:
+        f.write(b''.join(lines[:150]))
+    with compression.open_file(file_name, 'ab', dictionary=dictionary) as f:
+        f.write(b''.join(lines[150:]))
+
+    with compression.open_file(file_name) as f:
+        assert f.read() == b''.join(lines)
+
+    with pytest.raises(ValueError):
+        compression.open_file(file_name, 'ab', dictionary=b'another dictionary')
+
+
+def test_dictionary_other_formats(tmpdir):
+    # The dictionary is only used for .zst files.
+    file_name = str(tmpdir.join('tweets.gz'))
+
+    with compression.open_file(file_name, 'wb', dictionary=b'dictionary') as f:
+        f.write(b'one\n')
+
+    with compression.open_file(file_name) as f:
+        assert f.read() == b'one\n'
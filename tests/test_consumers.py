@@ -1,3 +1,7 @@
+import gzip
+
+from io import BytesIO, TextIOWrapper
+
 try:
     from StringIO import StringIO
 except ImportError:
@@ -121,6 +125,25 @@ def test_uniq(tweets):
     assert len(result)
 
 
+def test_record_ids(tweets):
+    ids = set()
+    first, second = [], []
+    target = consumers.to_tweet(
+        consumers.uniq(
+            consumers.split(consumers.record_ids(to_list(first), ids), consumers.record_ids(to_list(second), ids)),
+            ids=ids,
+            remember=False,
+        )
+    )
+    from_iterable(target, tweets * 2)
+
+    # Each target gets a tweet once.
+    assert [t.id for t in first] == [t.id for t in second] == [
+        190800262909276162, 195415832510201856, 201239221502099456,
+    ]
+    assert len(ids) == 3
+
+
 def test_closing():
     sink = to_list([])
     target = consumers.to_tweet(sink)
@@ -258,6 +281,29 @@ def test_count_timeline(tweets):
     )
 
 
+@pytest.mark.parametrize('window', ['%Y-%m-%d', '%Y-%m-%d %H:%M:%S'])
+def test_count_timeline_batches(tweets, window):
+    expected = Counter(Tweet(t).created_at.strftime(window) for t in tweets)
+    counter = Counter()
+    counts = []
+
+    from_iterable(
+        consumers.to_tweet(
+            consumers.timeline(counter, window=window, batch_size=2, target=from_counts(counts)),
+        ),
+        tweets,
+    )
+
+    assert counter == expected
+    assert counts == [expected]
+
+
+@consumers.consumer
+def from_counts(counts):
+    while True:
+        counts.append((yield))
+
+
 def test_count_tokens(tweets):
     counter = Counter()
 
@@ -285,3 +331,102 @@ def test_count_tokens(tweets):
             u'#pp12': 1,
         }
     )
+
+
+def test_to_tweet_lazy(tweets):
+    result = []
+    from_iterable(
+        consumers.to_tweet(to_list(result), fields=('id', )),
+        ('{"delete": {"status": {"id": 1}}}', ) + tweets,
+    )
+
+    assert [t.id for t in result] == [190800262909276162, 195415832510201856, 201239221502099456]
+    assert all(t._parsed is None for t in result)
+
+
+def test_extract_retweets(tweets, monkeypatch):
+    from poultry import jsonlib
+
+    retweet = jsonlib.loads(tweets[1])
+    retweet['retweeted_status'] = jsonlib.loads(tweets[0])
+    retweet = jsonlib.dumps(retweet)
+
+    decoded = []
+    loads = jsonlib.loads
+
+    def counting_loads(s):
+        decoded.append(s)
+        return loads(s)
+
+    monkeypatch.setattr(jsonlib, 'loads', counting_loads)
+
+    result = []
+    from_iterable(
+        consumers.extract_retweets(consumers.to_tweet(to_list(result))),
+        [retweet, tweets[2], 'not valid JSON'],
+    )
+
+    assert [t.id for t in result] == [190800262909276162, 195415832510201856, 201239221502099456]
+    assert decoded == [retweet, tweets[2], 'not valid JSON']
+
+    assert jsonlib.loads(result[0].raw) == jsonlib.loads(tweets[0])
+
+
+def test_print_tweets(tweets):
+    output = StringIO()
+    from_iterable(consumers.to_tweet(consumers.print_(output=output, template='{}')), tweets)
+
+    assert output.getvalue() == '\n'.join(tweets) + '\n'
+
+
+def test_print_binary(tweets):
+    buffer = BytesIO()
+    output = TextIOWrapper(buffer, encoding='utf-8')
+    lines = [t.encode('utf-8') + b'\n' for t in tweets]
+
+    from_iterable(consumers.print_(output=output, template='{}'), lines)
+    output.flush()
+
+    assert buffer.getvalue() == b''.join(lines)
+
+
+def test_group_binary(tweets, tmpdir, monkeypatch):
+    monkeypatch.chdir(tmpdir)
+    lines = [t.encode('utf-8') for t in tweets]
+
+    from_iterable(consumers.to_tweet(consumers.group('%Y-%m.gz')), lines)
+
+    with gzip.open(str(tmpdir.join('2012-04.gz'))) as f:
+        assert f.read() == lines[0] + b'\n' + lines[1] + b'\n'
+    with gzip.open(str(tmpdir.join('2012-05.gz'))) as f:
+        assert f.read() == lines[2] + b'\n'
+
+
+def test_group_reopen(tweets, tmpdir, monkeypatch):
+    monkeypatch.chdir(tmpdir)
+    lines = [t.encode('utf-8') for t in tweets]
+
+    # The tweets alternate between months, only one file is kept open.
+    from_iterable(
+        consumers.to_tweet(consumers.group('%Y-%m.gz', max_open_files=1, mode='w')),
+        [lines[0], lines[2], lines[1]],
+    )
+
+    with gzip.open(str(tmpdir.join('2012-04.gz'))) as f:
+        assert f.read() == lines[0] + b'\n' + lines[1] + b'\n'
+    with gzip.open(str(tmpdir.join('2012-05.gz'))) as f:
+        assert f.read() == lines[2] + b'\n'
+
+
+def test_sample():
+    items = []
+    from_iterable(consumers.sample(items, 10), range(1000))
+
+    assert len(items) == 10
+    assert len(set(items)) == 10
+    assert max(items) > 10
+
+    items = []
+    from_iterable(consumers.sample(items, 10), range(5))
+
+    assert items == list(range(5))
@@ -0,0 +1,81 @@
+from random import Random
+
+from poultry.dedup import BloomFilter, IdIndex, SlidingWindow
+
+
+def test_sliding_window():
+    random = Random(0)
+    ids = SlidingWindow(window=10)
+
+    start = 190800262909276162
+    seen = set()
+    for i in range(3000):
+        # The tweets are roughly ordered by time, some are repeated.
+        id_ = start + ((i * 10 + random.randint(-2000, 2000)) << 22)
+        if seen and random.random() < 0.3:
+            id_ = random.choice(sorted(seen)[-50:])
+
+        assert (id_ in ids) == (id_ in seen)
+        ids.add(id_)
+        seen.add(id_)
+
+    # 3000 tweets arrive during 30 seconds.
+    assert len(ids) < 1500
+    assert 12345 not in ids
+    ids.add(12345)
+    assert 12345 in ids
+
+
+def test_bloom_filter():
+    random = Random(0)
+    ids = BloomFilter.for_capacity(10000, error_rate=0.01)
+
+    added = [random.getrandbits(63) for _ in range(10000)]
+    for id_ in added:
+        ids.add(id_)
+
+    assert all(id_ in ids for id_ in added)
+
+    false_positives = sum(random.getrandbits(63) in ids for _ in range(10000))
+    assert false_positives < 200
+
+
+def test_id_index(tmpdir):
+    random = Random(0)
+    path = str(tmpdir.join('ids'))
+    added = set()
+
+    for run in range(3):
+        with IdIndex(path, compact_threshold=100) as ids:
+            assert len(ids) == len(added)
+
+            for _ in range(250):
+                id_ = random.getrandbits(64) if random.random() < 0.7 else random.choice(sorted(added) or [1])
+                assert (id_ in ids) == (id_ in added)
+
+                ids.add(id_)
+                added.add(id_)
+
+    with IdIndex(path) as ids:
+        ids.compact()
+        assert len(ids) == len(added)
+
+    with open(path, 'rb') as f:
+        data = f.read()
+    stored = [int.from_bytes(data[i:i + 8], 'little') for i in range(0, len(data), 8)]
+    assert stored == sorted(added)
+
+
+def test_id_index_incomplete_log(tmpdir):
+    path = str(tmpdir.join('ids'))
+
+    with IdIndex(path) as ids:
+        ids.add(1)
+    with open(path + '.log', 'ab') as f:
+        f.write(b'\x02\x00')
+
+    with IdIndex(path) as ids:
+        ids.add(3)
+
+    with IdIndex(path) as ids:
+        assert (len(ids), 1 in ids, 3 in ids) == (2, True, True)
@@ -0,0 +1,96 @@
+from poultry import jsonlib
+
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def restore_backend():
+    backend = jsonlib.backend
+    yield
+    jsonlib.set_backend(backend)
+
+
+def test_set_backend():
+    assert jsonlib.set_backend('json') == 'json'
+    assert jsonlib.loads('{"a": [1, 2]}') == {'a': [1, 2]}
+    assert jsonlib.loads(b'{"a": [1, 2]}') == {'a': [1, 2]}
+
+
+def test_set_backend_unknown():
+    with pytest.raises(ValueError):
+        jsonlib.set_backend('yaml')
+
+
+def test_environment_backend_unknown(monkeypatch, caplog):
+    monkeypatch.setenv(jsonlib.ENVIRONMENT_VARIABLE, 'simdjson')
+
+    assert jsonlib._set_environment_backend() in jsonlib.available_backends()
+    assert 'simdjson' in caplog.text
+
+
+def test_set_backend_fallback(monkeypatch):
+    def missing():
+        raise ImportError()
+
+    monkeypatch.setitem(jsonlib.BACKENDS, 'orjson', missing)
+    monkeypatch.setitem(jsonlib.BACKENDS, 'ujson', missing)
+
+    assert jsonlib.set_backend('orjson') == 'json'
+    assert jsonlib.available_backends() == ['json']
+
+
+@pytest.mark.parametrize('backend', jsonlib.available_backends())
+def test_backends(backend, tweets):
+    from poultry.tweet import Tweet
+
+    jsonlib.set_backend(backend)
+    tweet = Tweet(tweets[2])
+
+    assert tweet.text == u'that\'s fun “@gorban: http://t.co/rsjGQjCB”'
+    assert jsonlib.loads(jsonlib.dumps(tweet.parsed)) == tweet.parsed
+
+
+def test_benchmark(tweets):
+    result = jsonlib.benchmark(tweets, backends=['json'], repeat=1)
+
+    assert list(result) == ['json']
+    assert result['json'] > 0
+
+
+LONE_SURROGATE = b'{"id": 1, "text": "truncated \\ud83d"}'
+
+
+@pytest.mark.parametrize('backend', jsonlib.available_backends())
+def test_lone_surrogate(backend):
+    from poultry.tweet import Tweet
+
+    jsonlib.set_backend(backend)
+
+    assert Tweet(LONE_SURROGATE).text == u'truncated \ud83d'
+
+
+def test_fallback(monkeypatch):
+    import json
+
+    def strict_loads(s):
+        if b'\\ud83d' in s:
+            raise ValueError('A lone surrogate.')
+        return json.loads(s)
+
+    monkeypatch.setitem(jsonlib.BACKENDS, 'orjson', lambda: jsonlib._with_fallback(strict_loads))
+    assert jsonlib.set_backend('orjson') == 'orjson'
+
+    assert jsonlib.loads(LONE_SURROGATE) == {'id': 1, 'text': u'truncated \ud83d'}
+    with pytest.raises(ValueError):
+        jsonlib.loads(b'{"id": 1, "text": "trunc')
+
+
+@pytest.mark.parametrize('backend', jsonlib.available_backends())
+def test_dumps(backend):
+    import json
+
+    jsonlib.set_backend(backend)
+    obj = {'text': u'that\'s fun “@gorban: http://t.co/rsjGQjCB”', 'id': 1}
+
+    assert jsonlib.dumps(obj) == json.dumps(obj)
+    assert jsonlib.dumps(obj).isascii()
@@ -101,3 +101,397 @@ def test_timeline(capfd, tweets, poultry_cfg):
         u'2012-04-26-07 1\n'
         u'2012-05-12-09 1\n'
     )
+
+
+def test_filter(capsys, tweets, poultry_cfg, tweet_collection_dir):
+    poultry_cfg.write(
+        '[filter:pinkpop]\n'
+        'split_template = --\n'
+        'track = PinkPop\n'
+        'follow =\n'
+        'locations =\n'
+        'language =\n',
+        mode='a',
+    )
+
+    dispatcher.dispatch(
+        args='filter -s {} -c {}'.format(tweet_collection_dir, poultry_cfg).split(),
+        scriptname='poultry',
+    )
+
+    out, _ = capsys.readouterr()
+    assert out == tweets[0] + '\n'
+
+
+def test_filter_max_open_files(tmpdir, monkeypatch, capsys, tweets, poultry_cfg):
+    from poultry import consumers, writers
+
+    poultry_cfg.write(
+        '[poultry]\n'
+        'dustbin_template = dustbin-%Y.gz\n'
+        '[filter:pinkpop]\n'
+        'split_template = pinkpop-%Y.gz\n'
+        'track = PinkPop\n'
+        'follow =\n'
+        'locations =\n'
+        'language =\n'
+        '[filter:pygrunn]\n'
+        'split_template = pygrunn-%Y.gz\n'
+        'track = pygrunn\n'
+        'follow =\n'
+        'locations =\n'
+        'language =\n',
+        mode='a',
+    )
+    source = tmpdir.join('tweets')
+    source.write(u''.join(t + u'\n' for t in tweets))
+
+    limits = []
+
+    class WriterPool(writers.WriterPool):
+        def __init__(self, max_open_files, **kwargs):
+            limits.append(max_open_files)
+            super(WriterPool, self).__init__(max_open_files, **kwargs)
+
+    monkeypatch.setattr(consumers, 'WriterPool', WriterPool)
+    monkeypatch.chdir(tmpdir)
+
+    dispatcher.dispatch(
+        args='filter -s {} -c {} --max-open-files 7'.format(source, poultry_cfg).split(),
+        scriptname='poultry',
+    )
+
+    # The limit is shared by the two filters and the dustbin.
+    assert limits == [2, 2, 2]
+    assert sorted(f.basename for f in tmpdir.listdir(lambda f: f.ext == '.gz')) == [
+        'dustbin-2012.gz', 'pinkpop-2012.gz', 'pygrunn-2012.gz',
+    ]
+
+
+@pytest.mark.parametrize('command', ['group -t %Y-%m.gz', 'filter'])
+def test_jobs(tmpdir, monkeypatch, capsys, tweets, poultry_cfg, command):
+    import gzip
+
+    poultry_cfg.write(
+        '[filter:p]\n'
+        'split_template = p-%Y-%m.gz\n'
+        'track = pinkpop\n'
+        '    pygrunn\n'
+        'follow =\n'
+        'locations =\n'
+        'language =\n',
+        mode='a',
+    )
+
+    source = tmpdir.mkdir('source')
+    # The tweets of a month are split between the input files.
+    for i, lines in enumerate([tweets[1:], tweets[:1], tweets]):
+        with gzip.open(str(source.join('{}.gz'.format(i))), 'wt') as f:
+            f.write(u''.join(l + u'\n' for l in lines))
+
+    outputs = {}
+    for jobs in 1, 2:
+        monkeypatch.chdir(tmpdir.mkdir('jobs-{}'.format(jobs)))
+        dispatcher.dispatch(
+            args='{} -s {} -c {} -j {}'.format(command, source, poultry_cfg, jobs).split(),
+            scriptname='poultry',
+        )
+
+        outputs[jobs] = {}
+        for name in sorted(tmpdir.join('jobs-{}'.format(jobs)).listdir()):
+            with gzip.open(str(name)) as f:
+                outputs[jobs][name.basename] = f.read()
+
+    assert outputs[1] == outputs[2]
+    assert outputs[1]
+
+
+def test_jobs_modes(tmpdir, monkeypatch, capsys, tweets, poultry_cfg):
+    import gzip
+
+    poultry_cfg.write(
+        '[poultry]\n'
+        'dustbin_template = dustbin-%Y.gz\n'
+        '[filter:p]\n'
+        'split_template = p-%Y.gz\n'
+        'track = pinkpop\n'
+        'follow =\n'
+        'locations =\n'
+        'language =\n',
+        mode='a',
+    )
+
+    source = tmpdir.mkdir('source')
+    for i, tweet in enumerate(tweets):
+        source.join('{}.json'.format(i)).write(tweet + '\n')
+
+    outputs = {}
+    for jobs in 1, 3:
+        output_dir = tmpdir.mkdir('jobs-{}'.format(jobs))
+        monkeypatch.chdir(output_dir)
+
+        # The filter files are rewritten, the dustbin is appended to.
+        for _ in range(2):
+            dispatcher.dispatch(
+                args='filter -s {} -c {} --mode w -j {}'.format(source, poultry_cfg, jobs).split(),
+                scriptname='poultry',
+            )
+
+        outputs[jobs] = {}
+        for name in output_dir.listdir():
+            with gzip.open(str(name)) as f:
+                outputs[jobs][name.basename] = [l for l in f.read().splitlines() if l]
+
+    assert outputs[1] == outputs[3]
+    assert len(outputs[1]['p-2012.gz']) == 1
+    assert len(outputs[1]['dustbin-2012.gz']) == 4
+
+
+def test_jobs_statistics(tmpdir, monkeypatch, caplog, tweets, poultry_cfg):
+    import logging
+
+    poultry_cfg.write(
+        '[filter:p]\n'
+        'split_template = p-%Y-%m.gz\n'
+        'track = pinkpop\n'
+        '    pygrunn\n'
+        'follow =\n'
+        'locations =\n'
+        'language =\n',
+        mode='a',
+    )
+
+    source = tmpdir.mkdir('source')
+    for i, tweet in enumerate(tweets):
+        source.join('{}.json'.format(i)).write(tweet + '\n')
+
+    monkeypatch.chdir(tmpdir)
+    caplog.set_level(logging.DEBUG, logger='poultry.matchers')
+    dispatcher.dispatch(
+        args='filter -s {} -c {} -j 2'.format(source, poultry_cfg).split(),
+        scriptname='poultry',
+    )
+
+    # The two matching tweets are read by different workers.
+    messages = [r.getMessage() for r in caplog.records if r.name == 'poultry.matchers']
+    assert any(m.startswith('filter:p track: 2 evaluations, 2 passed') for m in messages)
+
+
+@pytest.mark.parametrize('mode', ['set', 'window', 'bloom'])
+def test_uniq(tmpdir, capsys, tweets, poultry_cfg, mode):
+    source = tmpdir.join('tweets')
+    source.write(u''.join(t + u'\n' for t in tweets + tweets[1:] + tweets[:1]))
+
+    dispatcher.dispatch(
+        args='uniq -s {} -c {} -m {} -w 1000 --memory 1'.format(source, poultry_cfg, mode).split(),
+        scriptname='poultry',
+    )
+
+    out, _ = capsys.readouterr()
+    assert out == u''.join(t + u'\n' for t in tweets)
+
+
+def test_uniq_id_index(tmpdir, capsys, tweets, poultry_cfg, tweet_collection_dir):
+    id_index = tmpdir.join('ids.index')
+    source = tmpdir.join('tweets')
+    source.write(u''.join(t + u'\n' for t in tweets[:1]))
+
+    dispatcher.dispatch(
+        args='index-ids -s {} -c {} -i {}'.format(source, poultry_cfg, id_index).split(),
+        scriptname='poultry',
+    )
+
+    for _ in range(2):
+        dispatcher.dispatch(
+            args='uniq -s {} -c {} --id-index {}'.format(tweet_collection_dir, poultry_cfg, id_index).split(),
+            scriptname='poultry',
+        )
+
+    out, _ = capsys.readouterr()
+    # The second run skips all the tweets.
+    assert out == u''.join(t + u'\n' for t in tweets[1:])
+
+
+def test_filter_id_index(tmpdir, monkeypatch, tweets, poultry_cfg):
+    import gzip
+
+    from poultry.dedup import IdIndex
+
+    poultry_cfg.write(
+        '[filter:pinkpop]\n'
+        'split_template = pinkpop-%Y.gz\n'
+        'track = pinkpop\n'
+        'follow =\n'
+        'locations =\n'
+        'language =\n'
+        '[filter:pp]\n'
+        'split_template = pp-%Y.gz\n'
+        'track = pinkpop\n'
+        '    pygrunn\n'
+        'follow =\n'
+        'locations =\n'
+        'language =\n'
+        '[filter:nobody]\n'
+        'split_template = nobody-%Y.gz\n'
+        'track =\n'
+        'follow = 1\n'
+        'locations =\n'
+        'language =\n',
+        mode='a',
+    )
+    id_index = tmpdir.join('ids.index')
+    source = tmpdir.join('tweets')
+    source.write(u''.join(t + u'\n' for t in tweets))
+
+    monkeypatch.chdir(tmpdir)
+    for _ in range(2):
+        dispatcher.dispatch(
+            args='filter -s {} -c {} --id-index {}'.format(source, poultry_cfg, id_index).split(),
+            scriptname='poultry',
+        )
+
+    # A tweet that matches both filters is written to both, the second run
+    # skips the written tweets.
+    for name, expected in ('pinkpop-2012.gz', tweets[:1]), ('pp-2012.gz', tweets[:2]):
+        with gzip.open(str(tmpdir.join(name))) as f:
+            assert [l for l in f.read().splitlines() if l] == [t.encode('utf-8') for t in expected]
+
+    # The tweet that didn't match any filter is not indexed.
+    with IdIndex(str(id_index)) as ids:
+        assert (len(ids), 190800262909276162 in ids, 201239221502099456 in ids) == (2, True, False)
+
+
+@pytest.mark.parametrize('sketch', ['space-saving', 'count-min', 'exact'])
+def test_top(tmpdir, capsys, tweets, poultry_cfg, sketch):
+    source = tmpdir.join('tweets')
+    source.write(u''.join(t + u'\n' for t in tweets + tweets[:1]))
+
+    dispatcher.dispatch(
+        args='top -s {} -c {} -k 2 --sketch {} --memory 1'.format(source, poultry_cfg, sketch).split(),
+        scriptname='poultry',
+    )
+
+    out, _ = capsys.readouterr()
+    lines = out.splitlines()
+    assert len(lines) == 2
+    assert all(line.endswith(' 2') for line in lines)
+
+
+def test_timeline_distinct(tmpdir, capsys, tweets, poultry_cfg):
+    source = tmpdir.join('tweets')
+    source.write(u''.join(t + u'\n' for t in tweets + tweets))
+    sketch_file = tmpdir.join('ids.hll')
+
+    for _ in range(2):
+        dispatcher.dispatch(
+            args='timeline -s {} -c {} -w %Y-%m --distinct id --sketch-file {}'.format(
+                source, poultry_cfg, sketch_file,
+            ).split(),
+            scriptname='poultry',
+        )
+
+        out, _ = capsys.readouterr()
+        assert out == (
+            u'2012-04 2\n'
+            u'2012-05 1\n'
+        )
+
+    dispatcher.dispatch(
+        args='timeline -s {} -c {} -w %Y --distinct hashtags'.format(source, poultry_cfg).split(),
+        scriptname='poultry',
+    )
+
+    out, _ = capsys.readouterr()
+    assert out == u'2012 2\n'
+
+    dispatcher.dispatch(
+        args='timeline -s {} -c {} -w %Y --distinct user_id'.format(source, poultry_cfg).split(),
+        scriptname='poultry',
+    )
+
+    out, _ = capsys.readouterr()
+    assert out == u'2012 1\n'
+
+    dispatcher.dispatch(
+        args='timeline -s {} -c {} -w %Y --distinct created_at'.format(source, poultry_cfg).split(),
+        scriptname='poultry',
+    )
+
+    out, _ = capsys.readouterr()
+    assert out == u'2012 3\n'
+
+    dispatcher.dispatch(
+        args='timeline -s {} -c {} -w %Y --distinct coordinates'.format(source, poultry_cfg).split(),
+        scriptname='poultry',
+    )
+
+    out, _ = capsys.readouterr()
+    assert out == u'2012 0\n'
+
+
+def test_filter_lone_surrogate(tmpdir, capsys, tweets, poultry_cfg):
+    poultry_cfg.write(
+        '[filter:pinkpop]\n'
+        'split_template = --\n'
+        'track = PinkPop\n'
+        'follow =\n'
+        'locations =\n'
+        'language =\n',
+        mode='a',
+    )
+
+    # A truncated emoji leaves a lone surrogate escape.
+    line = tweets[0].replace(':)', '\\ud83d')
+    source = tmpdir.join('tweets')
+    source.write(line + '\n')
+
+    dispatcher.dispatch(
+        args='filter -s {} -c {}'.format(source, poultry_cfg).split(),
+        scriptname='poultry',
+    )
+
+    out, _ = capsys.readouterr()
+    assert out == line + '\n'
+
+
+@pytest.mark.parametrize('command', [
+    'group -t %Y-%m.gz',
+    'uniq',
+    'timeline',
+    'timeline --distinct id',
+    'index-ids -i ids.index',
+])
+def test_lazy_invalid_lines(tmpdir, monkeypatch, capsys, tweets, poultry_cfg, command):
+    import gzip
+
+    invalid = [
+        tweets[0][:-40],
+        tweets[1][:300],
+        u'{"id": 1, "text": "a"}{"id": 2, "text": "b"}',
+        u'{"id": 1, "text": "a", "user": {"id": 2}',
+        u'{"id": 1, "created_at": "Fri Apr 13 13:55:02 +0000 2012", "text": "a}", "user": {"id": 2}',
+        u'{"id": 2, "created_at": "Fri Apr 13 13:55:02 +0000 2012", "entities": {"hashtags": [{"text": "x"}]}}',
+        u'not json at all',
+    ]
+
+    outputs = []
+    for name, lines in ('valid', tweets), ('invalid', invalid[:2] + list(tweets) + invalid[2:]):
+        source = tmpdir.join(name)
+        source.write(u''.join(l + u'\n' for l in lines))
+
+        monkeypatch.chdir(tmpdir.mkdir('{}-output'.format(name)))
+        dispatcher.dispatch(
+            args='{} -s {} -c {}'.format(command, source, poultry_cfg).split(),
+            scriptname='poultry',
+        )
+
+        out, _ = capsys.readouterr()
+        files = {}
+        for f in tmpdir.join('{}-output'.format(name)).listdir():
+            with (gzip.open if f.ext == '.gz' else open)(str(f), 'rb') as f_:
+                files[f.basename] = f_.read()
+
+        outputs.append((out, files))
+
+    assert outputs[0] == outputs[1]
+    assert outputs[0] != ('', {})
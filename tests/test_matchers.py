@@ -0,0 +1,206 @@
+import json
+
+from datetime import datetime
+from random import Random
+
+from poultry import jsonlib
+from poultry.config import Filter
+from poultry.matchers import FilterSet, LocationIndex, Matcher, RawPrefilter, TrackIndex
+from poultry.tweet import Coordinates, Tweet, intersect
+
+import pytest
+
+
+@pytest.fixture
+def geo_tweet(tweets):
+    tweet = jsonlib.loads(tweets[1])
+    tweet['coordinates'] = {'type': 'Point', 'coordinates': [6.5665, 53.2194]}
+    tweet['lang'] = 'en'
+
+    return Tweet(tweet)
+
+
+@pytest.mark.parametrize('predicates,expected', [
+    ({}, True),
+    ({'follow': ['10868922']}, True),
+    ({'follow': [1]}, False),
+    ({'follow': [12825292]}, False),
+    ({'track': ['PyGrunn']}, True),
+    ({'track': ['pygrunn here']}, True),
+    ({'track': ['pinkpop']}, False),
+    ({'locations': [((3.7, 51.5), (7.0, 53.7))]}, True),
+    ({'locations': [((3.7, 51.5), (5.6, 52.4))]}, False),
+    ({'locations': [((6.5665, 53.2194), (6.5665, 53.2194))]}, True),
+    ({'language': ['en']}, True),
+    ({'language': ['nl']}, False),
+    ({'track': ['pygrunn'], 'language': ['nl']}, False),
+    ({'track': ['pinkpop'], 'follow': [10868922]}, True),
+    ({'start_date': datetime(2012, 4, 26, 7, 35, 39)}, True),
+    ({'start_date': datetime(2012, 4, 26, 7, 35, 40)}, False),
+    ({'end_date': datetime(2012, 4, 26, 7, 35, 38)}, False),
+])
+def test_match(geo_tweet, predicates, expected):
+    matcher = Matcher(**predicates)
+
+    assert matcher.match(geo_tweet) is expected
+    assert matcher(geo_tweet, None) is expected
+    assert geo_tweet.filter(**predicates) is expected
+
+
+def test_immutable():
+    matcher = Matcher(track=['a'])
+
+    with pytest.raises(AttributeError):
+        matcher.track = ('b', )
+
+
+def test_compile(tweets):
+    filter_ = Filter(track=['PINKPOP'], follow=['1'], start_date='Fri Apr 13 13:55:02 +0000 2012')
+    matcher = filter_.compile()
+
+    assert matcher.track == ('pinkpop', )
+    assert matcher.follow == frozenset([1])
+    assert [matcher(Tweet(t)) for t in tweets] == [True, False, False]
+
+
+def test_track_index():
+    random = Random(0)
+    alphabet = u'abcé '
+    phrases = [''.join(random.choice(alphabet) for _ in range(random.randint(1, 4))) for _ in range(200)]
+    labelled = {}
+    for i, phrase in enumerate(phrases):
+        labelled.setdefault(phrase, set()).add(i % 7)
+
+    for scan_threshold in 0, 1000:
+        index = TrackIndex(labelled, scan_threshold=scan_threshold)
+
+        for _ in range(100):
+            text = ''.join(random.choice(alphabet) for _ in range(random.randint(0, 30)))
+            expected = set(l for p, ls in labelled.items() if p in text for l in ls)
+
+            assert index.search(text) == expected
+
+
+def test_filter_set(tweets, geo_tweet):
+    matchers = [
+        Matcher(track=['pinkpop', 'pygrunn']),
+        Matcher(follow=[10868922], language=['nl']),
+        Matcher(follow=[12825292, 1]),
+        Matcher(locations=[((3.7, 51.5), (7.0, 53.7))]),
+        Matcher(track=['fun'], start_date=datetime(2012, 5, 1)),
+        Matcher(),
+    ]
+    filter_set = FilterSet(matchers)
+
+    tweets = [jsonlib.loads(t) for t in tweets]
+    for tweet, lang in zip(tweets, ['en', 'nl', 'nl']):
+        tweet['lang'] = lang
+
+    for tweet in [Tweet(t) for t in tweets] + [geo_tweet]:
+        assert filter_set(tweet) == [i for i, m in enumerate(matchers) if m(tweet)]
+
+
+def test_filter_set_reorder(tweets, geo_tweet):
+    matchers = [
+        Matcher(track=['pinkpop', 'fun'], follow=[10868922], language=['en', 'nl']),
+        Matcher(locations=[((3.7, 51.5), (7.0, 53.7))], track=['pygrunn'], end_date=datetime(2013, 1, 1)),
+    ]
+    filter_set = FilterSet(matchers, names=['a', 'b'], reorder_every=2)
+
+    tweets = [jsonlib.loads(t) for t in tweets]
+    for tweet, lang in zip(tweets, ['en', 'nl', 'nl']):
+        tweet['lang'] = lang
+    tweets = [Tweet(t) for t in tweets] + [geo_tweet]
+
+    for _ in range(5):
+        for tweet in tweets:
+            assert filter_set(tweet) == [i for i, m in enumerate(matchers) if m(tweet)]
+
+    statistics = filter_set.statistics()
+    assert set((n, p) for n, p, _, _, _ in statistics) == set(
+        [
+            ('a', 'language'), ('a', 'main'), ('a', 'follow'), ('a', 'track'),
+            ('b', 'end_date'), ('b', 'main'), ('b', 'locations'), ('b', 'track'),
+        ]
+    )
+    assert all(passed <= evaluations for _, _, evaluations, passed, _ in statistics)
+    assert any(evaluations for _, _, evaluations, _, _ in statistics)
+
+    filter_set.log_statistics()
+
+
+def test_location_index():
+    random = Random(0)
+
+    def point():
+        return random.uniform(-20, 20), random.uniform(-20, 20)
+
+    boxes = {}
+    for i in range(300):
+        (a_lon, a_lat), (b_lon, b_lat) = point(), point()
+        box = (min(a_lon, b_lon), min(a_lat, b_lat)), (max(a_lon, b_lon), max(a_lat, b_lat))
+        boxes[box] = {i % 13}
+    boxes[((-180, -90), (180, 90))] = {13}
+    boxes[((1, 1), (1, 1))] = {14}
+
+    index = LocationIndex(boxes, cell_size=0.5, max_cells=64)
+
+    for lon, lat in [point() for _ in range(200)] + [(1, 1), (0.5, 0.5), (float('nan'), 0)]:
+        expected = set(
+            l for (sw, ne), ls in boxes.items()
+            if sw[0] <= lon <= ne[0] and sw[1] <= lat <= ne[1]
+            for l in ls
+        )
+        assert index.query_point(lon, lat) == expected
+
+    for _ in range(200):
+        (a_lon, a_lat), (b_lon, b_lat) = point(), point()
+        sw, ne = (min(a_lon, b_lon), min(a_lat, b_lat)), (max(a_lon, b_lon), max(a_lat, b_lat))
+
+        expected = set(
+            l for (b_sw, b_ne), ls in boxes.items()
+            if intersect([Coordinates(*sw), Coordinates(*ne)], [Coordinates(*b_sw), Coordinates(*b_ne)])
+            for l in ls
+        )
+        assert index.query_box(sw, ne) == expected
+
+
+def test_match_mentions(tweets):
+    one, _, three = (Tweet(t) for t in tweets)
+    matcher = Matcher(follow=['12825292'])
+
+    assert not matcher(one)
+    assert matcher(three)
+
+
+def test_raw_prefilter():
+    random = Random(0)
+    alphabet = 'aIkKpPo \u0130\u212a\u00e9"\\/#\n'
+
+    track = ['pop', 'kip', 'i\u0307p', '#ok', 'k\u00e9']
+    matcher = Matcher(track=track)
+    prefilter = RawPrefilter.from_matchers([matcher])
+
+    matched = dropped = 0
+    for _ in range(3000):
+        text = ''.join(random.choice(alphabet) for _ in range(random.randint(0, 8)))
+        line = json.dumps({'text': text}, ensure_ascii=random.random() < 0.5)
+        if random.random() < 0.5:
+            # Escape the ASCII letters and digits.
+            line = line.replace('p', '\\u0070').replace('K', '\\u004B')
+        line = line.encode('utf-8')
+
+        if matcher.match_track(Tweet(line)):
+            matched += 1
+            assert prefilter(line)
+        elif not prefilter(line):
+            dropped += 1
+
+    assert matched and dropped
+
+
+def test_raw_prefilter_from_matchers():
+    assert RawPrefilter.from_matchers([Matcher(track=['pop'], language=['en'])]) is not None
+    assert RawPrefilter.from_matchers([Matcher(track=['pop']), Matcher(follow=[1])]) is None
+    assert RawPrefilter.from_matchers([Matcher(track=['pop']), Matcher()]) is None
+    assert RawPrefilter.from_matchers([Matcher(track=['pop', ':)'])]) is None
@@ -0,0 +1,81 @@
+import gzip
+import struct
+
+from poultry import compression, consumers, parallel
+from poultry.producers import from_stream
+
+import pytest
+
+
+def dictionary_frame(dictionary):
+    return struct.pack('<II', compression.DICTIONARY_FRAME_MAGIC, len(dictionary)) + dictionary
+
+
+def test_combine(tmpdir):
+    parts = []
+    for i in range(3):
+        part = tmpdir.join('part-{}'.format(i))
+        part.write_binary(dictionary_frame(b'dictionary') + 'block {}\n'.format(i).encode('ascii'))
+        plain = tmpdir.join('plain-{}'.format(i))
+        plain.write_binary('plain {}\n'.format(i).encode('ascii'))
+
+        parts.append({str(tmpdir.join('out.zst')): str(part), str(tmpdir.join('out.txt')): str(plain)})
+
+    parallel.combine(parts, mode='w')
+
+    # The dictionary frame is written once.
+    assert tmpdir.join('out.zst').read_binary() == dictionary_frame(b'dictionary') + b'block 0\nblock 1\nblock 2\n'
+    assert tmpdir.join('out.txt').read_binary() == b'plain 0\nplain 1\nplain 2\n'
+
+    parallel.combine(parts[:1], mode='a')
+    assert tmpdir.join('out.zst').read_binary() == (
+        dictionary_frame(b'dictionary') + b'block 0\nblock 1\nblock 2\nblock 0\n'
+    )
+
+    tmpdir.join('part-0').write_binary(dictionary_frame(b'another dictionary') + b'block\n')
+    with pytest.raises(ValueError):
+        parallel.combine(parts[:1], mode='a')
+
+
+def test_combine_dictionary(tmpdir, tweets):
+    pytest.importorskip('zstandard')
+
+    lines = [
+        t.replace('190800262909276162', str(190800262909276162 + i)).encode('utf-8') + b'\n'
+        for i, t in enumerate(tweets * 100)
+    ]
+    dictionary = compression.train_dictionary(lines, size=2 ** 12)
+
+    parts = []
+    for i in range(3):
+        part = str(tmpdir.join('part-{}.zst'.format(i)))
+        with compression.open_file(part, 'wb', dictionary=dictionary) as f:
+            f.write(b''.join(lines[i::3]))
+        parts.append({str(tmpdir.join('tweets.zst')): part})
+
+    parallel.combine(parts, mode='w')
+
+    with compression.open_file(str(tmpdir.join('tweets.zst'))) as f:
+        assert f.read() == b''.join(lines[0::3] + lines[1::3] + lines[2::3])
+
+
+def build(rename, on_open, mode, threads):
+    target = consumers.group('%Y.gz', rename=rename, on_open=on_open, mode=mode, threads=threads)
+    return consumers.to_tweet(target, fields=('created_at', 'id')), lambda: len(threads._threads)
+
+
+def test_run(tmpdir, monkeypatch, tweets):
+    monkeypatch.chdir(tmpdir)
+
+    file_names = []
+    for i in range(3):
+        source = tmpdir.join('{}.json'.format(i))
+        source.write(tweets[i] + '\n')
+        file_names.append(str(source))
+
+    results = parallel.run(build, from_stream, file_names, 2, on_open=None, threads=3)
+
+    # The workers write the files with their own threads.
+    assert results == [3, 3, 3]
+    with gzip.open(str(tmpdir.join('2012.gz'))) as f:
+        assert [l for l in f.read().splitlines() if l] == [t.encode('utf-8') for t in tweets[:3]]
@@ -1,4 +1,5 @@
 from poultry import readline_dir
+from poultry.producers import consume_stream
 
 
 def test_readline_dir(tweet_collection_dir):
@@ -16,3 +17,10 @@ def test_readline_dir(tweet_collection_dir):
     assert t1.id == 190800262909276162
     assert t2.id == 195415832510201856
     assert t3.id == 201239221502099456
+
+
+def test_consume_stream_binary(tweet_collection_dir):
+    lines = list(consume_stream(None, tweet_collection_dir, binary=True))
+
+    assert len(lines) == 3
+    assert all(isinstance(l, bytes) for l in lines)
@@ -0,0 +1,136 @@
+from collections import Counter
+from io import BytesIO
+from random import Random
+
+from poultry.sketches import CountMinSketch, HyperLogLog, SpaceSaving, load_sketches, save_sketches
+
+import pytest
+
+
+def zipf_stream(n, seed=0):
+    random = Random(seed)
+    words = ['w{}'.format(i) for i in range(5000)]
+    weights = [1.0 / (i + 1) for i in range(len(words))]
+    return random.choices(words, weights, k=n)
+
+
+@pytest.mark.parametrize('batch_size', [1, 1000, 20000])
+def test_space_saving(batch_size):
+    stream = zipf_stream(20000)
+    exact = Counter(stream)
+
+    counter = SpaceSaving(200)
+    for i in range(0, len(stream), batch_size):
+        counter.update(stream[i:i + batch_size])
+
+    assert len(counter) == 200
+    assert counter.total == len(stream)
+
+    for item, count in counter.items():
+        assert exact[item] <= count <= exact[item] + counter.error(item)
+        assert counter.error(item) <= len(stream) // 200
+
+    # Items more frequent than the error bound are counted.
+    frequent = [i for i, c in exact.items() if c > len(stream) // 200]
+    assert frequent
+    assert all(i in counter for i in frequent)
+
+    assert [i for i, _ in counter.most_common(5)] == [i for i, _ in exact.most_common(5)]
+
+
+def test_count_min_sketch():
+    stream = zipf_stream(20000)
+    exact = Counter(stream)
+
+    sketch = CountMinSketch(512, k=5)
+    sketch.update(stream)
+
+    assert sketch.total == len(stream)
+    assert all(sketch[item] >= count for item, count in exact.items())
+
+    # The error is at most e * n / width with the probability of 1 - exp(-depth).
+    bound = len(stream) * 3 // 512
+    assert sum(sketch[item] > count + bound for item, count in exact.items()) < 0.05 * len(exact)
+
+    assert [i for i, _ in sketch.most_common()] == [i for i, _ in exact.most_common(5)]
+
+
+def test_count_min_sketch_merge():
+    first, second = zipf_stream(10000, seed=1), zipf_stream(10000, seed=2)
+
+    merged = CountMinSketch(512, k=5)
+    merged.update(first)
+    shard = CountMinSketch(512, k=5)
+    shard.update(second)
+    merged.update(shard)
+
+    whole = CountMinSketch(512, k=5)
+    whole.update(first + second)
+
+    assert merged._rows == whole._rows
+    assert merged.total == whole.total
+    assert [i for i, _ in merged.most_common(3)] == [i for i, _ in whole.most_common(3)]
+
+    with pytest.raises(ValueError):
+        merged.update(CountMinSketch(256))
+
+
+@pytest.mark.parametrize('factory', [lambda: SpaceSaving(1000), lambda: CountMinSketch(1024)])
+def test_count_tokens(tweets, factory):
+    from poultry import consumers
+    from poultry.tweet import Tweet
+
+    from .test_consumers import from_counts, from_iterable
+
+    counts = []
+    from_iterable(
+        consumers.to_tweet(
+            consumers.count_tokens(factory=factory, target=from_counts(counts)),
+        ),
+        tweets,
+    )
+
+    expected = Counter()
+    for tweet in map(Tweet, tweets):
+        expected.update(tweet.tokens)
+        expected.update(u'#{}'.format(h) for h in tweet.hashtags)
+
+    (counter, ) = counts
+    assert all(counter[item] == count for item, count in expected.items())
+
+
+@pytest.mark.parametrize('n', [10, 1000, 50000])
+def test_hyper_log_log(n):
+    sketch = HyperLogLog()
+    sketch.update(u'user{}'.format(i % n) for i in range(2 * n))
+
+    assert abs(len(sketch) - n) <= max(1, 0.05 * n)
+
+
+def test_hyper_log_log_merge():
+    first, second = HyperLogLog(10), HyperLogLog(10)
+    first.update(range(0, 3000))
+    second.update(range(2000, 5000))
+
+    whole = HyperLogLog(10)
+    whole.update(range(5000))
+
+    first.update(second)
+    assert first.registers == whole.registers
+
+    with pytest.raises(ValueError):
+        first.update(HyperLogLog(11))
+
+
+def test_save_sketches():
+    sketches = {u'2012-04-13': HyperLogLog(), u'2012-04-26': HyperLogLog(8)}
+    sketches[u'2012-04-13'].update([1, 2, 3])
+
+    f = BytesIO()
+    save_sketches(sketches, f)
+    f.seek(0)
+    loaded = load_sketches(f)
+
+    assert sorted(loaded) == sorted(sketches)
+    assert all(loaded[name].registers == sketch.registers for name, sketch in sketches.items())
+    assert loaded[u'2012-04-26'].precision == 8
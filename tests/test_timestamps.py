@@ -0,0 +1,74 @@
+from datetime import datetime, timedelta
+from email.utils import parsedate_tz
+from random import Random
+
+from poultry.timestamps import Bucketer, parse_created_at, snowflake_to_datetime
+
+import pytest
+
+
+@pytest.mark.parametrize('created_at', [
+    'Fri Apr 13 13:55:02 +0000 2012',
+    'Thu Apr 26 07:35:39 +0000 2012',
+    'Sat May 12 09:15:43 +0000 2012',
+    'Sun Jan 01 00:00:00 +0000 2017',
+    'Tue Dec 31 23:59:59 +0100 2019',
+    '13 Apr 2012 13:55:02 +0000',
+    'Fri, 13 Apr 2012 13:55:02 GMT',
+])
+def test_parse_created_at(created_at):
+    assert parse_created_at(created_at) == datetime(*parsedate_tz(created_at)[:6])
+
+
+def test_snowflake(tweets):
+    from poultry.tweet import Tweet
+
+    for tweet in map(Tweet, tweets):
+        assert snowflake_to_datetime(tweet.id) == tweet.created_at
+
+
+def test_snowflake_old_id():
+    assert snowflake_to_datetime(12345) is None
+
+
+@pytest.mark.parametrize('template', [
+    '%Y-%m-%d-%H.gz',
+    '%Y-%m-%d-%H',
+    'by_day/%Y-%m-%d.gz',
+    '%Y-%m',
+    '%Y/%j/%a %b %-d %I%p',
+    '%G-W%V-%u %H:%M',
+    '%H:%M:%S',
+    'constant',
+    '%%H %Y',
+])
+def test_bucketer(template):
+    random = Random(0)
+    bucketer = Bucketer(template, max_cache_size=64)
+
+    start = datetime(2011, 12, 25)
+    for _ in range(2000):
+        dt = start + timedelta(seconds=random.randint(0, 400 * 86400))
+        assert bucketer(dt) == dt.strftime(template)
+
+
+@pytest.mark.parametrize('backend', ['numpy', None])
+@pytest.mark.parametrize('template', ['%Y-%m-%d-%H', '%H', '%Y-%m-%d %H:%M'])
+def test_bucketer_counts(monkeypatch, backend, template):
+    from collections import Counter
+    from poultry import timestamps
+
+    if backend is None:
+        monkeypatch.setattr(timestamps, 'numpy', None)
+    else:
+        pytest.importorskip(backend)
+
+    random = Random(0)
+    bucketer = Bucketer(template)
+
+    start = datetime(2011, 12, 25)
+    dts = [start + timedelta(seconds=random.randint(0, 400 * 86400)) for _ in range(2000)]
+
+    expected = Counter(dt.strftime(template) for dt in dts)
+    assert bucketer.counts([timestamps.datetime_to_seconds(dt) for dt in dts]) == expected
+    assert bucketer.counts([]) == {}
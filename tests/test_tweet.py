@@ -1,3 +1,5 @@
+from datetime import datetime
+
 from poultry.tweet import Tweet, TweetValueError, intersect, Coordinates
 
 import pytest
@@ -49,3 +51,114 @@ def test_intersect(a, b, expected):
     b = [Coordinates(*c) for c in b]
 
     assert intersect(a, b) == expected
+
+
+def test_lazy(tweets):
+    tweet = Tweet(tweets[0], fields=('created_at', 'id'))
+
+    assert tweet.id == 190800262909276162
+    assert tweet.created_at == datetime(2012, 4, 13, 13, 55, 2)
+    assert tweet._parsed is None
+
+    assert tweet.text.startswith('pinkpop')
+    assert tweet._parsed is not None
+
+
+def test_lazy_nested_field():
+    tweet = Tweet('{"user": {"id": 1}, "id": 2, "text": ""}', fields=('id', ))
+
+    assert tweet.id == 2
+
+
+@pytest.mark.parametrize('raw', [
+    '{"delete": {"status": {"id": 1}}}',
+    '{"id": 1, "created_at": "Fri Apr 13 13:55:02 +0000 2012", "entities": {"hashtags": [{"text": "x"}]}}',
+    '{"event": "favorite", "target_object": {"id": 1, "text": "a"}}',
+])
+def test_lazy_invalid(raw):
+    # Only a top level text field makes a tweet.
+    with raises(TweetValueError):
+        Tweet(raw, fields=('id', ))
+
+
+@pytest.mark.parametrize('raw', [
+    '{"text": "a", "id": 1 ...',
+    '{"created_at": "Fri Apr 13 13:55:02 +0000 2012", "id": 1, "text": "trunc',
+    '{"id": 1, "text": "a", "user": {"id": 2}',
+    '{"id": 1, "text": "a"}{"id": 2, "text": "b"}',
+    '{"id": 1, "text": "a", "b": {"c": "x"}, "d": "}',
+    '{"id": 1, "text": "a\\", "b": "}"}',
+    '{"id": 1, "text": "a}", "user": {"id": 2}',
+    '{"id": 1, "text": "a", "b": [1}]',
+])
+@pytest.mark.parametrize('type_', [str, bytes])
+def test_lazy_truncated(raw, type_):
+    if type_ is bytes:
+        raw = raw.encode('utf-8')
+
+    with raises(TweetValueError):
+        Tweet(raw, fields=('id', 'created_at'))
+
+
+@pytest.mark.parametrize(('raw', 'text'), [
+    ('{"id": 1, "text": "{[\\"quoted\\"]"}', '{["quoted"]'),
+    ('{"id": 1, "text": "}{"}', '}{'),
+    ('{"id": 1, "user": {"text": "a"}, "text": "b"}', 'b'),
+])
+def test_lazy_strings(raw, text):
+    # The brackets and the keys inside strings and nested objects are skipped.
+    tweet = Tweet(raw, fields=('id', ))
+
+    assert tweet._parsed is None
+    assert tweet.id == 1
+    assert tweet.text == text
+
+
+def test_memoized(tweets):
+    tweet = Tweet(tweets[2])
+
+    assert not hasattr(tweet, '__dict__')
+
+    assert tweet.user_mentions == {'gorban'}
+    assert tweet.user_mentions is tweet.user_mentions
+    assert tweet.tokens is tweet.tokens
+
+
+def test_created_at_setter(tweets):
+    tweet = Tweet(tweets[0])
+    tweet.created_at = datetime(2000, 1, 1)
+
+    assert tweet.created_at == datetime(2000, 1, 1)
+    assert tweet.orig_created_at == datetime(2012, 4, 13, 13, 55, 2)
+
+
+@pytest.mark.parametrize('fields', [None, ('id', 'created_at')])
+def test_created_at_from_id(fields):
+    tweet = Tweet('{"id": 190800262909276162, "text": ""}', fields=fields)
+    assert tweet.created_at == datetime(2012, 4, 13, 13, 55, 2)
+
+    # The id is decoded instead of created_at.
+    tweet = Tweet(
+        '{"created_at": "Sat May 12 09:15:43 +0000 2012", "id": 190800262909276162, "text": ""}',
+        fields=fields,
+    )
+    assert tweet.created_at == datetime(2012, 4, 13, 13, 55, 2)
+
+    # Ids that were not generated by Snowflake don't encode the time.
+    tweet = Tweet('{"created_at": "Sat May 12 09:15:43 +0000 2012", "id": 1000, "text": ""}', fields=fields)
+    assert tweet.created_at == datetime(2012, 5, 12, 9, 15, 43)
+
+    assert Tweet('{"id": 1000, "text": ""}', fields=fields).created_at is None
+
+
+def test_bytes(tweets):
+    raw = tweets[2].encode('utf-8')
+
+    tweet = Tweet(raw)
+    assert tweet.raw is raw
+    assert tweet.user_mentions == {'gorban'}
+
+    tweet = Tweet(raw, fields=('id', 'created_at'))
+    assert tweet.id == 201239221502099456
+    assert tweet.created_at == datetime(2012, 5, 12, 9, 15, 43)
+    assert tweet._parsed is None
@@ -0,0 +1,72 @@
+from collections import Counter
+from io import BytesIO
+from random import Random
+
+from poultry.vocabulary import Vocabulary
+
+import pytest
+
+
+def token_stream(n, seed=0):
+    random = Random(seed)
+    return [u'tok{}'.format(random.randint(0, 2000)) for _ in range(n)] + [u'птица']
+
+
+@pytest.mark.parametrize('batch_size', [1, 100, 10000])
+def test_vocabulary(batch_size):
+    stream = token_stream(10000)
+    vocabulary = Vocabulary()
+    for i in range(0, len(stream), batch_size):
+        vocabulary.update(stream[i:i + batch_size])
+
+    exact = Counter(stream)
+    assert dict(vocabulary.items()) == exact
+    assert len(vocabulary) == len(exact)
+    assert vocabulary.tokens() == list(exact)
+    assert vocabulary.most_common(3) == exact.most_common(3)
+
+    assert u'птица' in vocabulary
+    assert u'missing' not in vocabulary
+    assert vocabulary[u'missing'] == 0
+    assert vocabulary.id(u'missing') is None
+    assert vocabulary.token(vocabulary.id(u'tok7')) == u'tok7'
+
+
+def test_vocabulary_save_merge():
+    first, second = token_stream(5000, seed=1), token_stream(5000, seed=2)
+
+    shards = []
+    for stream in first, second:
+        vocabulary = Vocabulary()
+        vocabulary.update(stream)
+
+        f = BytesIO()
+        vocabulary.save(f)
+        f.seek(0)
+        shards.append(Vocabulary.load(f))
+
+    merged = Vocabulary()
+    for shard in shards:
+        merged.update(shard)
+
+    assert dict(merged.items()) == Counter(first + second)
+
+    # A loaded vocabulary can be updated.
+    shards[0].update([u'tok1', u'new'])
+    assert shards[0][u'new'] == 1
+    assert shards[0][u'tok1'] == Counter(first)[u'tok1'] + 1
+
+    with pytest.raises(ValueError):
+        Vocabulary.load(BytesIO(b'\0' * 20))
+
+
+def test_count_tokens(tweets):
+    from poultry import consumers
+
+    from .test_consumers import from_iterable
+
+    vocabulary = Vocabulary()
+    counter = Counter()
+    from_iterable(consumers.to_tweet(consumers.count_tokens(vocabulary, counter)), tweets)
+
+    assert dict(vocabulary.items()) == counter
@@ -0,0 +1,95 @@
+import gzip
+
+from io import BytesIO
+
+from poultry.writers import WriterPool, WriterThreads
+
+import pytest
+
+
+class File(BytesIO):
+    def __init__(self, mode):
+        super(File, self).__init__()
+        self.mode = mode
+        self.writes = []
+
+    def write(self, data):
+        self.writes.append(data)
+        return super(File, self).write(data)
+
+    def close(self):
+        self.closed_value = self.getvalue()
+        super(File, self).close()
+
+
+def test_writer_pool():
+    files = []
+
+    def opener(name, mode):
+        files.append((name, File(mode)))
+        return files[-1][1]
+
+    with WriterPool(2, mode='w', opener=opener, buffer_size=4) as pool:
+        for name in 'abacab':
+            pool.write(name, name.encode('ascii') * 3)
+
+        a, = [f for n, f in files if n == 'a']
+        # Two writes to `a` are flushed in one block.
+        assert a.writes == [b'aaaaaa']
+
+    assert [(n, f.mode) for n, f in files] == [('a', 'wb'), ('b', 'wb'), ('c', 'wb'), ('b', 'ab')]
+    assert [f.closed_value for _, f in files] == [b'aaaaaaaaa', b'bbb', b'ccc', b'bbb']
+    assert (pool.opens, pool.evictions, pool.reopens) == (4, 2, 1)
+
+
+def test_writer_threads(tmpdir):
+    threads = WriterThreads(3, queue_size=2)
+    names = [str(tmpdir.join('{}.gz'.format(i))) for i in range(7)]
+
+    with WriterPool(4, threads=threads, buffer_size=16) as pool:
+        for i in range(500):
+            pool.write(names[i % 7], '{}\n'.format(i).encode('ascii'))
+
+    threads.join()
+
+    for j, name in enumerate(names):
+        with gzip.open(name) as f:
+            assert f.read() == b''.join(
+                '{}\n'.format(i).encode('ascii') for i in range(500) if i % 7 == j
+            )
+
+
+def test_writer_threads_error(tmpdir):
+    threads = WriterThreads(1)
+
+    with WriterPool(threads=threads) as pool:
+        pool.write(str(tmpdir.join('missing', 'file.gz')), b'data')
+
+    with pytest.raises(IOError):
+        threads.join()
+
+
+def test_writer_threads_open_error():
+    threads = WriterThreads(2, queue_size=1)
+    error = OSError('Too many open files')
+
+    def opener(name, mode):
+        if name == 'b':
+            raise error
+        return File(mode)
+
+    with pytest.raises(OSError) as e:
+        with WriterPool(2, mode='w', opener=opener, threads=threads, buffer_size=1) as pool:
+            for i in range(100):
+                pool.write('abc'[i % 3], b'data')
+    assert e.value is error
+
+    # The error is kept until the threads are joined.
+    with pytest.raises(OSError) as e:
+        threads.submit('a', list)
+    assert e.value is error
+
+    for _ in range(2):
+        with pytest.raises(OSError) as e:
+            threads.join()
+        assert e.value is error